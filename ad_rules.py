@@ -0,0 +1,105 @@
+import json
+import os
+import re
+import time
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+AD_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ad_rules.json")
+
+class AdRule:
+    """
+    One entry of the rule file. A rule is either a `literal` string that is
+    removed verbatim, or a list of regex `patterns`, precompiled and applied
+    one after another in file order. They are not merged into one
+    alternation: a broad pattern later in the list (such as a 🏴‍☠️ ... catch-all)
+    would then match from an earlier position than the specific ones before
+    it, and remove more. A rule with a `prefilter` only runs when at least
+    one of its literal strings is in the message.
+    """
+
+    def __init__(self, spec):
+        self.name = spec.get("name", "unnamed rule")
+        self.prefilter = tuple(spec.get("prefilter", ()))
+        self.literal = spec.get("literal")
+        self.regexes = ()
+        if self.literal is None:
+            self.regexes = tuple(re.compile(pattern, re.MULTILINE) for pattern in spec["patterns"])
+
+    def apply(self, text):
+        if self.literal is not None:
+            return text.replace(self.literal, "")
+        if self.prefilter and not any(literal in text for literal in self.prefilter):
+            return text
+        for regex in self.regexes:
+            text = regex.sub("", text)
+        return text
+
+def _normalize_channel_id(channel_id):
+    # Accept both the "-100..." form used in config.py and the bare id Telethon reports
+    channel_id = str(channel_id)
+    if channel_id.startswith("-100"):
+        channel_id = channel_id[4:]
+    return channel_id
+
+class AdRuleEngine:
+    """
+    Loads ad-stripping rules from a JSON file and applies them.
+
+    The file has a "default" list of rules applied to every message and a
+    "channels" map of extra rules per source channel id. The file is
+    re-read when it changes on disk, checked at most every
+    `reload_interval` seconds; a broken file is reported and the previous
+    rules are kept.
+    """
+
+    def __init__(self, path=AD_RULES_FILE, reload_interval=5):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.default_rules = []
+        self.channel_rules = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            default_rules = [AdRule(spec) for spec in data.get("default", [])]
+            channel_rules = {
+                _normalize_channel_id(channel_id): [AdRule(spec) for spec in specs]
+                for channel_id, specs in data.get("channels", {}).items()
+            }
+        except (OSError, ValueError, KeyError, re.error) as e:
+            log.error(f"Could not load ad rules from {self.path}: {e}")
+            return False
+        self.default_rules = default_rules
+        self.channel_rules = channel_rules
+        self._mtime = mtime
+        return True
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime and self.reload():
+            log.info(f"Reloaded ad rules from {self.path}")
+
+    def rules_for(self, channel_id=None):
+        self._reload_if_changed()
+        if channel_id is None:
+            return self.default_rules
+        return self.default_rules + self.channel_rules.get(_normalize_channel_id(channel_id), [])
+
+    def strip(self, text, channel_id=None):
+        for rule in self.rules_for(channel_id):
+            text = rule.apply(text)
+        return text
@@ -0,0 +1,48 @@
+import asyncio
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+# Telegram albums hold at most 10 photos/videos
+MAX_ALBUM_PARTS = 10
+
+class AlbumAggregator:
+    """
+    Collects the messages of a Telegram album, which arrive as separate
+    messages sharing a grouped_id. An album is handed to `on_album` once no
+    new part has arrived for `window_seconds`, or as soon as it is full.
+    """
+
+    def __init__(self, on_album, window_seconds=1.0):
+        self.on_album = on_album
+        self.window_seconds = window_seconds
+        self._albums = {}  # key -> (messages, catching_up, timer task)
+
+    async def add(self, key, message, catching_up=False):
+        messages, catching_up, timer = self._albums.get(key, ([], catching_up, None))
+        messages.append(message)
+        if timer:
+            timer.cancel()
+        if len(messages) >= MAX_ALBUM_PARTS:
+            del self._albums[key]
+            await self.on_album(messages, catching_up)
+            return
+        timer = asyncio.create_task(self._flush_later(key))
+        self._albums[key] = (messages, catching_up, timer)
+
+    async def _flush_later(self, key):
+        await asyncio.sleep(self.window_seconds)
+        messages, catching_up, _ = self._albums.pop(key)
+        try:
+            await self.on_album(messages, catching_up)
+        except Exception as e:
+            log.error(f"Error submitting album {key}: {e}")
+
+    def pending(self):
+        return len(self._albums)
+
+    def close(self):
+        # Unfinished albums aren't marked processed, so catch-up picks them up after a restart
+        for _, _, timer in self._albums.values():
+            timer.cancel()
+        self._albums.clear()
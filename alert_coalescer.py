@@ -0,0 +1,157 @@
+import asyncio
+import time
+from dataclasses import replace
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+class AlertBurst:
+    """
+    Alerts of one kind from one channel, merged into a single post per
+    target. `version` goes up whenever a merged alert adds areas, and
+    `shown` records which version each target's post currently displays
+    (or, for a target whose post failed, the version last tried there).
+    """
+
+    def __init__(self, alert, context, now, channel_id=None):
+        self.channel_id = channel_id
+        self.alert = replace(alert, areas=list(alert.areas))
+        self.first_areas = list(alert.areas)
+        self.context = context
+        self.started_at = now
+        self.version = 0
+        self.posts = {}  # target -> (chat_id, message_id)
+        self.shown = {}  # target -> version shown by that post
+        self.failed_targets = set()  # targets the post didn't reach
+        self.last_edit_at = 0.0
+        self.edit_task = None
+        self.first_post_over = False  # every target's send of the first alert is over
+        self.failed = False  # the first alert reached no target
+
+    def merge(self, alert):
+        new_areas = [area for area in alert.areas if area not in self.alert.areas]
+        if not new_areas:
+            return False
+        self.alert.areas.extend(new_areas)
+        if alert.date_time:
+            self.alert.date_time = alert.date_time
+        self.version += 1
+        return True
+
+    def stale_targets(self):
+        # Targets without a post only get one once it's clear the burst has a post somewhere
+        targets = self.shown if self.first_post_over else self.posts
+        return [target for target in targets if self.shown[target] < self.version]
+
+    def merged_areas(self):
+        return [area for area in self.alert.areas if area not in self.first_areas]
+
+class AlertCoalescer:
+    """
+    Collapses alert bursts into one post per target.
+
+    The first alert of a kind starts a burst and is posted as usual.
+    Alerts of the same kind from the same channel within `window_seconds`
+    of it add their areas to the burst instead of being posted, and
+    `on_edit(burst, targets)` is called to edit the existing posts. A
+    burst's posts are edited at most once every
+    `min_edit_interval_seconds`; areas that arrive in between go out
+    together in the next edit.
+
+    Targets the first alert's post didn't reach get the merged alert as a
+    new post instead, through `on_post(burst, targets)`, which calls
+    record_post() or record_failure() for each target. If the first post
+    reached no target at all (see first_post_done()), the burst is dropped
+    and the areas merged into it are posted as a new burst, so they aren't
+    lost with it.
+    """
+
+    def __init__(self, on_edit, on_post, window_seconds=60, min_edit_interval_seconds=3):
+        self.on_edit = on_edit
+        self.on_post = on_post
+        self.window_seconds = window_seconds
+        self.min_edit_interval_seconds = min_edit_interval_seconds
+        self._bursts = {}  # (channel_id, kind) -> AlertBurst
+
+    def add(self, channel_id, alert, context=None):
+        """
+        Returns (burst, is_new). When is_new is False the alert has been
+        merged into a burst that is already being posted, and needs no
+        post of its own.
+        """
+        now = time.monotonic()
+        key = (channel_id, alert.kind)
+        burst = self._bursts.get(key)
+        if burst is None or burst.failed or now - burst.started_at >= self.window_seconds:
+            burst = self._bursts[key] = AlertBurst(alert, context, now, channel_id)
+            return burst, True
+        if burst.merge(alert):
+            self._schedule_edit(burst)
+        return burst, False
+
+    def record_post(self, burst, target, chat_id, message_id, version=0):
+        # Called once the first alert's post is out; catches up on areas merged meanwhile
+        burst.posts[target] = (chat_id, message_id)
+        burst.failed_targets.discard(target)
+        burst.shown[target] = version
+        if version < burst.version:
+            self._schedule_edit(burst)
+
+    def record_failure(self, burst, target, version=0):
+        # The post to `target` didn't go out; areas merged since are posted there anew
+        burst.failed_targets.add(target)
+        burst.shown[target] = version
+        if burst.first_post_over and version < burst.version:
+            self._schedule_edit(burst)
+
+    def first_post_done(self, burst):
+        # Called once every target's send of the first alert is over, whether it worked or not
+        burst.first_post_over = True
+        if burst.posts:
+            if burst.stale_targets():
+                self._schedule_edit(burst)
+            return
+        burst.failed = True
+        key = (burst.channel_id, burst.alert.kind)
+        if self._bursts.get(key) is burst:
+            del self._bursts[key]
+        merged_areas = burst.merged_areas()
+        log.warning(
+            f"First {burst.alert.kind} alert of a burst was not posted anywhere, "
+            f"{'posting its merged areas as a new burst' if merged_areas else 'the next one starts a new burst'}",
+            kind=burst.alert.kind, merged_areas=merged_areas
+        )
+        if merged_areas and key not in self._bursts:
+            resubmitted = AlertBurst(replace(burst.alert, areas=merged_areas), burst.context, time.monotonic(), burst.channel_id)
+            self._bursts[key] = resubmitted
+            asyncio.create_task(self._post_first(resubmitted, sorted(burst.failed_targets)))
+
+    async def _post_first(self, burst, targets):
+        try:
+            await self.on_post(burst, targets)
+        except Exception as e:
+            log.error(f"Error posting {burst.alert.kind} alert: {e}", kind=burst.alert.kind)
+        self.first_post_done(burst)
+
+    def _schedule_edit(self, burst):
+        if burst.edit_task is None or burst.edit_task.done():
+            burst.edit_task = asyncio.create_task(self._edit_loop(burst))
+
+    async def _edit_loop(self, burst):
+        while burst.stale_targets():
+            wait = burst.last_edit_at + self.min_edit_interval_seconds - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            version = burst.version
+            targets = burst.stale_targets()
+            burst.last_edit_at = time.monotonic()
+            try:
+                await asyncio.gather(
+                    self.on_edit(burst, [target for target in targets if target in burst.posts]),
+                    self.on_post(burst, [target for target in targets if target not in burst.posts])
+                )
+            except Exception as e:
+                log.error(f"Error updating {burst.alert.kind} alert posts: {e}", kind=burst.alert.kind)
+            # Marked shown even after an error, so a failing edit isn't retried in a loop
+            for target in targets:
+                burst.shown[target] = max(burst.shown[target], version)
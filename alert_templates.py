@@ -0,0 +1,100 @@
+import asyncio
+from message_cleaner import Alert
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+# Hebrew -> English names of the Home Front Command alert areas
+AREA_NAMES_EN = {
+    "אילת": "Eilat",
+    "בקעה": "Jordan Valley",
+    "בקעת בית שאן": "Beit She'an Valley",
+    "גולן דרום": "Southern Golan",
+    "גולן צפון": "Northern Golan",
+    "גליל עליון": "Upper Galilee",
+    "גליל תחתון": "Lower Galilee",
+    "דן": "Dan",
+    "דרום הנגב": "Southern Negev",
+    "המפרץ": "HaMifratz",
+    "העמקים": "HaAmakim",
+    "השפלה": "Shfela",
+    "ואדי ערה": "Wadi Ara",
+    "חוף הכרמל": "Carmel Coast",
+    "חיפה": "Haifa",
+    "יהודה": "Judea",
+    "ים המלח": "Dead Sea",
+    "ירושלים": "Jerusalem",
+    "ירקון": "Yarkon",
+    "לכיש": "Lachish",
+    "מנשה": "Menashe",
+    "מערב הנגב": "Western Negev",
+    "מערב לכיש": "Western Lachish",
+    "מרכז הגליל": "Central Galilee",
+    "מרכז הנגב": "Central Negev",
+    "עוטף עזה": "Gaza Envelope",
+    "ערבה": "Arava",
+    "קו העימות": "Confrontation Line",
+    "קריות": "Krayot",
+    "שומרון": "Samaria",
+    "שפלת יהודה": "Judean Foothills",
+    "שרון": "Sharon",
+    "תבור": "Tavor",
+}
+
+ALERT_TITLES_EN = {
+    "flash": "🚨 Flash Alert",
+    "red": "🚨 Red Alert",
+    "rocket": "🚨 Rocket/Missile Fire",
+    "exit": "🚨 Shelter Exit Update",
+    "ended": "🚨 Event Ended Update",
+}
+
+INSTRUCTIONS_EN = {
+    "היכנסו למרחב המוגן": "Enter the protected space",
+    "היכנסו למרחב המוגן ושהו בו 10 דקות": "Enter the protected space and stay there for 10 minutes",
+    "ניתן לצאת מהמרחב המוגן": "You may leave the protected space",
+    "ניתן לצאת מהמרחב המוגן אך יש להישאר בקרבתו": "You may leave the protected space but should stay nearby",
+    "השוהים במרחב המוגן יכולים לצאת": "Those in the protected space may leave",
+}
+
+EXPECTED_ALERTS_EN = "Alerts are expected in your area in the coming minutes"
+UNKNOWN_AREAS_EN = "Unknown areas"
+PIKUD_FOOTER_EN = "This message was received from the Home Front Command"
+
+async def _translate_or_keep(text, translate_unknown):
+    # Fall back to the Hebrew text rather than dropping it
+    try:
+        return await translate_unknown(text)
+    except Exception as e:
+        log.warning(f"Could not translate alert text '{text}': {e}")
+        return text
+
+async def render_alert_en(alert: Alert, translate_unknown) -> str:
+    """
+    Render the English version of an alert from templates.
+    `translate_unknown(text)` is a coroutine used only for area names and
+    instructions that aren't in the tables above, so known alerts never
+    wait on a translation backend.
+    """
+    unknown = [area for area in alert.areas if area not in AREA_NAMES_EN]
+    instruction = alert.instruction.strip()
+    if instruction and instruction not in INSTRUCTIONS_EN:
+        unknown.append(instruction)
+    translated = {}
+    if unknown:
+        log.info(f"Translating alert text missing from the gazetteer: {unknown}")
+        results = await asyncio.gather(*(_translate_or_keep(text, translate_unknown) for text in unknown))
+        translated = dict(zip(unknown, results))
+
+    areas = [AREA_NAMES_EN.get(area) or translated[area] for area in alert.areas]
+    regions_str = ", ".join(areas) if areas else UNKNOWN_AREAS_EN
+    if alert.kind == "area":
+        return f"{EXPECTED_ALERTS_EN}\nMain areas: {regions_str}"
+    title = ALERT_TITLES_EN.get(alert.kind, "📡 Alert")
+    summary = f"{title}{' - ' + alert.date_time if alert.date_time else ''}"
+    if alert.kind == "flash":
+        summary += f"\n{EXPECTED_ALERTS_EN}"
+    summary += f"\nMain areas: {regions_str}"
+    if instruction:
+        summary += f"\n{INSTRUCTIONS_EN.get(instruction) or translated[instruction]}"
+    return summary
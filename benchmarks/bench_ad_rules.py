@@ -0,0 +1,64 @@
+"""
+Micro-benchmark for ad stripping: the old ten-pass remove_specific_ad_block
+against the rule engine in ad_rules.py, on the posts in corpus.jsonl.
+
+    python benchmarks/bench_ad_rules.py [corpus.jsonl] [rounds]
+"""
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_cleaner import remove_specific_ad_block
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.jsonl")
+
+def legacy_remove_specific_ad_block(text):
+    # remove_specific_ad_block as it was before the rule engine
+    ad_block_patterns = [
+        r"🏴‍☠️ ?\*\*אם אתה לא כאן אתה לא מעודכן\*\*\s*\*\*חפשו אותנו בטלגרם\*\*\s*\[24\*6 NEWS\]\(https://t\.me/News24x6\)\s*\[24\*6 NEWS DISCUSSIONS\]\(https://t\.me/Group24x6\)",
+        r"🏴‍☠️ ?\*\*לא צריך לעבור מערוץ לערוץ,\*\*\s*\*\*כל (החדשות|הידיעות) בערוץ אחד!\*\*\s*\[24\*6 NEWS\]\(https://t\.me/News24x6\)\s*\[24\*6 NEWS DISCUSSIONS\]\(https://t\.me/Group24x6\)",
+        r"🏴‍☠️ ?\*\*כל הדיווחים בערוץ אחד,\*\*\s*\*\*וללא צנזורה!\*\*\s*\[24\*6 NEWS\]\(https://t\.me/News24x6\)\s*\[24\*6 NEWS DISCUSSIONS\]\(https://t\.me/Group24x6\)",
+        r"🏴‍☠️ ?אם אתה לא כאן אתה לא מעודכן\s*חפשו אותנו בטלגרם",
+        r"🏴‍☠️ ?\*\*אם אתה לא כאן\*\*, \*\*אתה לא מעודכן\*\*!\s*\[ערוץ צבע אדום מבית 24X6 NEWS\]\(https://t\.me/red_alert_24x6\)",
+        r"🇮🇱 יש לכם חשבון טלגרם פרימיום ? אנחנו ממש נשמח שתתנו לנו BOOST \(https?://t\.me/boost/News24x6\)\.\s*",
+        r"🏴‍☠️[\s\S]*?24\*6 NEWS \(https?://t\.me/News24x6\)\s*24\*6 NEWS DISCUSSIONS \(https?://t\.me/Group24x6\)[\d¹]*",
+        r"🏴‍☠️[\s\S]*?\[24\*6 NEWS\]\(https?://t\.me/News24x6\)\s*\[24\*6 NEWS DISCUSSIONS\]\(https?://t\.me/Group24x6\)[\d¹]*",
+        r"🅾️🆂🅸🅽🆃Cosmos🎗️",
+        r"([\u0590-\u05FF \w'\".\-]+)\nhttps?://t\.me/\S+",
+    ]
+    cleaned = text
+    for pattern in ad_block_patterns:
+        cleaned = re.sub(pattern, '', cleaned, flags=re.MULTILINE)
+    cleaned = re.sub(r'\n{2,}', '\n\n', cleaned).strip()
+    return cleaned
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def time_per_message(func, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            func(text)
+    return (time.perf_counter() - start) / (rounds * len(texts))
+
+if __name__ == "__main__":
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else CORPUS_FILE
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    texts = [post["text"] for post in load_corpus(corpus_path) if post.get("text")]
+
+    mismatches = [t for t in texts if legacy_remove_specific_ad_block(t) != remove_specific_ad_block(t)]
+    print(f"{len(texts)} posts, {len(mismatches)} with different output")
+    for text in mismatches:
+        print("--- Mismatch ---\n" + text)
+
+    before = time_per_message(legacy_remove_specific_ad_block, texts, rounds)
+    after = time_per_message(remove_specific_ad_block, texts, rounds)
+    print(f"before: {before * 1e6:8.1f} us/message")
+    print(f"after:  {after * 1e6:8.1f} us/message")
+    print(f"speedup: {before / after:.1f}x")
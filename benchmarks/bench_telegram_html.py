@@ -0,0 +1,143 @@
+"""
+Conformance checks and micro-benchmark for telegram_html: the old five-pass
+regex markdown_to_telegram_html against the one-pass renderer, on the posts
+in corpus.jsonl (raw and after cleaning).
+
+    python benchmarks/bench_telegram_html.py [corpus.jsonl] [rounds]
+
+Exits with status 1 if a conformance check fails.
+"""
+import json
+import os
+import re
+import sys
+import time
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_cleaner import parse_message
+from telegram_html import caption_html, markdown_to_telegram_html
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.jsonl")
+
+# (Markdown, expected HTML), from real channel posts
+CASES = [
+    ("**דיווח:** פיצוצים עזים נשמעו באזור **טהרן**, עדי ראייה מדווחים על עשן מעל בסיס צבאי.",
+     "<b>דיווח:</b> פיצוצים עזים נשמעו באזור <b>טהרן</b>, עדי ראייה מדווחים על עשן מעל בסיס צבאי."),
+    ("***בלעדי:*** בכיר בממשל האמריקני: \"ההחלטה תתקבל בימים הקרובים\"",
+     "<b><i>בלעדי:</i></b> בכיר בממשל האמריקני: \"ההחלטה תתקבל בימים הקרובים\""),
+    ("[קישור לכתבה המלאה](https://example.com/article) - *פרטים נוספים בהמשך*",
+     "<a href=\"https://example.com/article\">קישור לכתבה המלאה</a> - <i>פרטים נוספים בהמשך</i>"),
+    ("[24*6 NEWS](https://t.me/News24x6)\n[24*6 NEWS DISCUSSIONS](https://t.me/Group24x6)",
+     "<a href=\"https://t.me/News24x6\">24*6 NEWS</a>\n<a href=\"https://t.me/Group24x6\">24*6 NEWS DISCUSSIONS</a>"),
+    ("🏴‍☠️ **אם אתה לא כאן**, **אתה לא מעודכן**!\n[ערוץ צבע אדום מבית 24X6 NEWS](https://t.me/red_alert_24x6)",
+     "🏴‍☠️ <b>אם אתה לא כאן</b>, <b>אתה לא מעודכן</b>!\n"
+     "<a href=\"https://t.me/red_alert_24x6\">ערוץ צבע אדום מבית 24X6 NEWS</a>"),
+    ("חדשות הצפון\nhttps://t.me/north_news",
+     "חדשות הצפון\nhttps://t.me/north_news"),
+    ("**מחירי הנפט** קפצו ב->6% אחרי התקיפה, מדד S&P 500 ירד ב-1.2%",
+     "<b>מחירי הנפט</b> קפצו ב-&gt;6% אחרי התקיפה, מדד S&amp;P 500 ירד ב-1.2%"),
+    ("דובר צה\"ל: <b>אין</b> שינוי בהנחיות. פרטים: https://www.oref.org.il/heb/alerts_history_page",
+     "דובר צה\"ל: &lt;b&gt;אין&lt;/b&gt; שינוי בהנחיות. פרטים: https://www.oref.org.il/heb/alerts_history_page"),
+    ("__עדכון__ _חשוב_", "<b>עדכון</b> <i>חשוב</i>"),
+    ("**בלי סוף\nשורה שנייה**", "**בלי סוף\nשורה שנייה**"),
+    ("[מקור](https://example.com/a?id=1&lang=he)",
+     "<a href=\"https://example.com/a?id=1&amp;lang=he\">מקור</a>"),
+]
+
+# (header, Markdown, channel title, expected caption)
+CAPTION_CASES = [
+    ("News:", "**דיווח:** פיצוץ בנמל", "24x6 NEWS",
+     "<b>News:</b>\n<b>דיווח:</b> פיצוץ בנמל\n\n(<i>24x6 NEWS</i>)"),
+    ("News (EN):", "Explosion at the port", "News & Updates <Live>",
+     "<b>News (EN):</b>\nExplosion at the port\n\n(<i>News &amp; Updates &lt;Live&gt;</i>)"),
+]
+
+def legacy_markdown_to_telegram_html(text):
+    # markdown_to_telegram_html as it was before telegram_html.py
+    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
+    text = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'<i>\1</i>', text)
+    text = re.sub(r'(?<!_)_(?!_)(.+?)(?<!_)_(?!_)', r'<i>\1</i>', text)
+    text = re.sub(r'\[(.+?)\]\((https?://[^\s]+)\)', r'<a href="\2">\1</a>', text)
+    return text
+
+class _TagChecker(HTMLParser):
+    """Collects why a string isn't well-formed Telegram HTML, if it isn't."""
+    ALLOWED_TAGS = {"b", "i", "a"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = []
+        self.errors = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in self.ALLOWED_TAGS:
+            self.errors.append(f"unexpected <{tag}>")
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack[-1] != tag:
+            self.errors.append(f"misnested </{tag}>")
+        else:
+            self.stack.pop()
+
+def html_errors(html):
+    if re.search(r"&(?!(?:amp|lt|gt|quot);)|<(?![/a-z])|(?<![a-z\"])>", html):
+        return ["unescaped &, < or >"]
+    checker = _TagChecker()
+    checker.feed(html)
+    checker.close()
+    return checker.errors + [f"unclosed <{tag}>" for tag in checker.stack]
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def time_per_message(func, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            func(text)
+    return (time.perf_counter() - start) / (rounds * len(texts))
+
+if __name__ == "__main__":
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else CORPUS_FILE
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    texts = []
+    for post in load_corpus(corpus_path):
+        if post.get("text"):
+            texts.append(post["text"])
+            texts.append(parse_message(post["text"], post["channel_id"]).body)
+
+    failures = 0
+    for markdown, expected in CASES:
+        html = markdown_to_telegram_html(markdown)
+        if html != expected:
+            failures += 1
+            print(f"--- Wrong output ---\n{markdown}\nexpected: {expected}\n     got: {html}")
+    for header, markdown, channel_name, expected in CAPTION_CASES:
+        html = caption_html(header, markdown, channel_name)
+        if html != expected or html_errors(html):
+            failures += 1
+            print(f"--- Wrong caption ---\n{channel_name}\nexpected: {expected}\n     got: {html}")
+    legacy_broken = 0
+    for text in texts:
+        errors = html_errors(markdown_to_telegram_html(text))
+        if errors:
+            failures += 1
+            print(f"--- Malformed output ({', '.join(errors)}) ---\n{text}")
+        if html_errors(legacy_markdown_to_telegram_html(text)):
+            legacy_broken += 1
+    print(f"{len(CASES) + len(CAPTION_CASES)} cases, {len(texts)} posts: {failures} failures "
+          f"(the regex version produced malformed HTML for {legacy_broken} posts)")
+
+    uncached = markdown_to_telegram_html.__wrapped__
+    before = time_per_message(legacy_markdown_to_telegram_html, texts, rounds)
+    after = time_per_message(uncached, texts, rounds)
+    cached = time_per_message(markdown_to_telegram_html, texts, rounds)
+    print(f"regex:    {before * 1e6:8.1f} us/message")
+    print(f"one-pass: {after * 1e6:8.1f} us/message ({before / after:.1f}x)")
+    print(f"cached:   {cached * 1e6:8.1f} us/message ({before / cached:.1f}x)")
+    sys.exit(1 if failures else 0)
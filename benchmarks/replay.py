@@ -0,0 +1,256 @@
+"""
+Replay benchmark: feeds the posts in corpus.jsonl through the bot's real
+handler and pipeline, with Telegram and the translator replaced by local
+stand-ins, and reports throughput, end-to-end latency per message kind
+and time spent in each pipeline stage.
+
+    python benchmarks/replay.py [--corpus corpus.jsonl] [--rounds 1] [--speedup 0]
+                                [--translate-latency 0.8] [--translate-jitter 0.5]
+                                [--send-latency 0.05] [--rate-limits] [--log-level INFO]
+
+--speedup 0 replays as fast as the pipeline accepts messages; otherwise the
+gaps between post dates are divided by it. Each round after the first adds
+a round marker to news posts and starts, once the previous round has
+drained, with a fresh dedup index and alert coalescer, so rounds aren't
+skipped as duplicates of each other. The bot's log goes, through its usual
+background writer, to replay.log in the run's temporary directory.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.jsonl")
+
+# main_bot refuses to start without these; nothing here talks to Telegram
+for name, value in (("TELEGRAM_BOT_TOKEN", "0:replay"), ("TELETHON_API_ID", "1"),
+                    ("TELETHON_API_HASH", "replay"), ("GEMINI_API_KEY", "replay")):
+    os.environ.setdefault(name, value)
+
+# Keep the session file and state database of the run out of the working tree
+os.chdir(tempfile.mkdtemp(prefix="replay-"))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main_bot
+    import translator
+from alert_coalescer import AlertCoalescer
+from dedup import DedupIndex
+from send_scheduler import SendScheduler
+from structured_log import setup_logging
+from telethon.tl.types import PeerChannel
+from translation_backends import StubBackend
+from translation_policy import TranslationPolicy
+
+CHANNEL_TITLES = {
+    2726720354: "24x6 NEWS",
+    1441886157: "פיקוד העורף",
+    1987654321: "Cosmos",
+    1876543210: "Other",
+}
+
+class FakeBot:
+    """Records Bot API calls instead of making them, after `latency` seconds."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = []
+        self._next_id = 0
+
+    async def _reply(self, method, chat_id, count=1):
+        await asyncio.sleep(self.latency)
+        self.calls.append((method, chat_id))
+        replies = []
+        for _ in range(count):
+            self._next_id += 1
+            file = SimpleNamespace(file_id=f"file-{self._next_id}")
+            replies.append(SimpleNamespace(message_id=self._next_id, photo=[file], video=file))
+        return replies if count > 1 else replies[0]
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._reply("send_message", chat_id)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        return await self._reply("send_photo", chat_id)
+
+    async def send_video(self, chat_id, video, **kwargs):
+        return await self._reply("send_video", chat_id)
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        return await self._reply("send_media_group", chat_id, count=len(media))
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        return await self._reply("edit_message_text", chat_id)
+
+async def fake_get_entity(entity):
+    if isinstance(entity, list):
+        return [await fake_get_entity(item) for item in entity]
+    channel_id = entity.channel_id if isinstance(entity, PeerChannel) else main_bot.utils.resolve_id(entity)[0]
+    return SimpleNamespace(id=channel_id, title=CHANNEL_TITLES.get(channel_id, str(channel_id)), username=None)
+
+async def fake_download_media(message, file):
+    await asyncio.sleep(0.01)
+    file.write(b"\0" * (200_000 if message.video else 50_000))
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def make_message(post, message_id, text, grouped_id):
+    media = post.get("media")
+    return SimpleNamespace(
+        id=message_id,
+        text=text,
+        photo=object() if media == "photo" else None,
+        video=object() if media == "video" else None,
+        media=media,
+        grouped_id=grouped_id,
+        peer_id=PeerChannel(post["channel_id"]),
+        date=datetime.datetime.now(datetime.timezone.utc),
+    )
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+async def replay(corpus, rounds, speedup):
+    received_at = {}  # (channel_id, message_id) -> when the event was delivered
+    finished = []  # (kind, end-to-end seconds, job)
+    skip_reasons = {}
+    original_finish_job = main_bot.finish_job
+    original_skip_job = main_bot.skip_job
+
+    def finish_job(job):
+        latency = time.monotonic() - min(received_at[(job.channel_id, part.id)] for part in job.parts)
+        kind = "skipped" if getattr(job, "skip_reason", None) else job.parsed.kind
+        # The last stage's time is added after this returns, so keep the job and read it at the end
+        finished.append((kind, latency, job))
+        original_finish_job(job)
+
+    def skip_job(job, reason, description):
+        job.skip_reason = reason
+        skip_reasons[reason] = skip_reasons.get(reason, 0) + 1
+        return original_skip_job(job, reason, description)
+
+    main_bot.finish_job = finish_job
+    main_bot.skip_job = skip_job
+
+    authority_ids = main_bot.channel_registry.authority_ids
+    main_bot.pipeline.start()
+    await main_bot.channel_registry.preload(list(CHANNEL_TITLES))
+    start = time.monotonic()
+    submitted = 0
+    for round_number in range(rounds):
+        main_bot.dedup_index = DedupIndex(
+            window_seconds=main_bot.config.DEDUP_WINDOW_SECONDS,
+            threshold=main_bot.config.DEDUP_SIMILARITY_THRESHOLD
+        )
+        main_bot.alert_coalescer = AlertCoalescer(
+            main_bot.edit_alert_posts,
+            main_bot.post_alert,
+            window_seconds=main_bot.config.ALERT_COALESCE_WINDOW_SECONDS,
+            min_edit_interval_seconds=main_bot.config.ALERT_EDIT_MIN_INTERVAL_SECONDS
+        )
+        previous_date = None
+        for post in corpus:
+            if speedup and previous_date is not None:
+                await asyncio.sleep(max(0, post["date"] - previous_date) / speedup)
+            previous_date = post["date"]
+            text = post["text"]
+            if round_number and text and post["channel_id"] not in authority_ids:
+                text += f"\n#{round_number}"
+            message_id = post["message_id"] + round_number * 100_000
+            grouped_id = post["grouped_id"] + round_number if post.get("grouped_id") else None
+            message = make_message(post, message_id, text, grouped_id)
+            received_at[(post["channel_id"], message_id)] = time.monotonic()
+            await main_bot.handle_new_source_message(SimpleNamespace(message=message))
+            submitted += 1
+        # Let the round finish before the dedup index and coalescer are replaced;
+        # albums wait in the aggregator before they reach the pipeline
+        while main_bot.album_aggregator.pending():
+            await asyncio.sleep(0.01)
+        await main_bot.pipeline.join()
+    elapsed = time.monotonic() - start
+    await main_bot.pipeline.stop()
+    stage_times = [(kind, latency, job.stage_times) for kind, latency, job in finished]
+    return submitted, elapsed, stage_times, skip_reasons
+
+def report(submitted, elapsed, finished, skip_reasons, bot):
+    print(f"{submitted} messages in {elapsed:.2f}s: {submitted / elapsed:.1f} msgs/sec")
+    sends = {}
+    for method, _ in bot.calls:
+        sends[method] = sends.get(method, 0) + 1
+    print("Bot API calls: " + ", ".join(f"{method}={count}" for method, count in sorted(sends.items())))
+
+    print(f"\n{'kind':<10} {'jobs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    by_kind = {}
+    for kind, latency, _ in finished:
+        by_kind.setdefault(kind, []).append(latency * 1000)
+    for kind, latencies in sorted(by_kind.items()):
+        print(f"{kind:<10} {len(latencies):>5} {percentile(latencies, 0.5):>9.1f} "
+              f"{percentile(latencies, 0.95):>9.1f} {percentile(latencies, 0.99):>9.1f}")
+
+    if skip_reasons:
+        print("\nSkipped: " + ", ".join(f"{reason}={count}" for reason, count in sorted(skip_reasons.items())))
+
+    print(f"\n{'stage':<12} {'jobs':>5} {'mean ms':>9} {'p95 ms':>9} {'total s':>9}")
+    by_stage = {}
+    for _, _, stage_times in finished:
+        for stage, seconds in stage_times.items():
+            by_stage.setdefault(stage, []).append(seconds * 1000)
+    for stage in main_bot.pipeline.stages:
+        times = by_stage.get(stage)
+        if times:
+            print(f"{stage:<12} {len(times):>5} {sum(times) / len(times):>9.2f} "
+                  f"{percentile(times, 0.95):>9.2f} {sum(times) / 1000:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded posts through the bot with local stand-ins")
+    parser.add_argument("--corpus", default=CORPUS_FILE)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--speedup", type=float, default=0, help="0 replays without waiting between posts")
+    parser.add_argument("--translate-latency", type=float, default=0.8, help="median translator latency in seconds")
+    parser.add_argument("--translate-jitter", type=float, default=0.5, help="sigma of the log-normal latency")
+    parser.add_argument("--send-latency", type=float, default=0.05, help="latency of each Bot API call in seconds")
+    parser.add_argument("--rate-limits", action="store_true", help="keep Telegram's per-chat send limits")
+    parser.add_argument("--log-level", default="INFO", help="level of the bot's log, e.g. DEBUG to include its debug records")
+    args = parser.parse_args()
+
+    log_file = os.path.abspath("replay.log")
+    setup_logging(level=args.log_level, log_file=log_file, stream=None)
+
+    def translate_latency():
+        if not args.translate_latency:
+            return 0.0
+        return random.lognormvariate(math.log(args.translate_latency), args.translate_jitter)
+
+    translator.translation_policy = TranslationPolicy(
+        [StubBackend(latency=translate_latency)],
+        deadline_seconds=main_bot.config.TRANSLATION_TIMEOUT_SECONDS
+    )
+    bot = FakeBot(latency=args.send_latency)
+    if args.rate_limits:
+        main_bot.send_scheduler = SendScheduler(bot)
+    else:
+        main_bot.send_scheduler = SendScheduler(bot, chat_rate_per_minute=1e9, chat_burst=1e9, global_rate_per_second=1e9)
+    main_bot.telethon_client.get_entity = fake_get_entity
+    main_bot.telethon_client.download_media = fake_download_media
+
+    corpus = load_corpus(args.corpus)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(replay(corpus, args.rounds, args.speedup))
+    report(*results, bot)
+    print(f"\nLog: {log_file}")
+
+if __name__ == "__main__":
+    main()
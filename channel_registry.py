@@ -0,0 +1,118 @@
+import asyncio
+from dataclasses import dataclass
+from metrics import metrics
+from telethon import utils
+from telethon.tl.types import PeerChannel
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+# Posts from a channel with one of these titles get the פיקוד העורף footer
+PIKUD_HAOREF_NAMES = {"פיקוד העורף", "Home Front Command"}
+
+def bare_channel_id(channel_id):
+    # Marked ids (-100...) from config and bare ids from message.peer_id map to the same key
+    return utils.resolve_id(channel_id)[0]
+
+@dataclass
+class ChannelInfo:
+    channel_id: int  # bare id, as in message.peer_id.channel_id
+    title: str
+    username: str = None
+    is_alert_authority: bool = False  # may post alerts
+    is_pikud_haoref: bool = False  # gets the פיקוד העורף footer
+
+class ChannelRegistry:
+    """
+    Titles and flags of the source channels, looked up by channel id
+    without a network round-trip. preload() resolves the configured
+    channels in one bulk request at startup and run_refresher() keeps the
+    titles fresh. A channel that isn't known yet is answered from its id
+    and resolved in the background, unless `resolve_unknown` is off. In
+    sharded mode the shards resolve their channels and add() them here, and
+    the client is never started, so nothing is resolved in the background.
+    """
+
+    def __init__(self, client, authority_ids=(), resolve_unknown=True):
+        self.client = client
+        self.authority_ids = {bare_channel_id(channel_id) for channel_id in authority_ids}
+        self.resolve_unknown = resolve_unknown
+        self._channels = {}
+        self._resolving = set()
+
+    def _info(self, channel_id, entity=None):
+        title = getattr(entity, 'title', None) or getattr(entity, 'username', None) or str(channel_id)
+        is_alert_authority = channel_id in self.authority_ids
+        return ChannelInfo(
+            channel_id,
+            title,
+            username=getattr(entity, 'username', None),
+            is_alert_authority=is_alert_authority,
+            is_pikud_haoref=is_alert_authority or title.strip() in PIKUD_HAOREF_NAMES
+        )
+
+    def add(self, entity):
+        # Anything with id, title and username will do, e.g. a Telethon Channel
+        self._channels[entity.id] = self._info(entity.id, entity)
+
+    async def preload(self, entities):
+        """
+        Resolve `entities` (marked ids or usernames), in bulk where
+        Telethon can.
+        """
+        if not entities:
+            return
+        try:
+            resolved = await self.client.get_entity(list(entities))
+        except Exception as e:
+            log.warning(f"Bulk channel lookup failed ({e}), resolving channels one by one")
+            resolved = []
+            for entity in entities:
+                try:
+                    resolved.append(await self.client.get_entity(entity))
+                except Exception as e:
+                    log.warning(f"Could not resolve source channel {entity}: {e}")
+        for entity in resolved:
+            self.add(entity)
+        log.info(f"Resolved {len(resolved)} of {len(entities)} source channels")
+
+    def get(self, channel_id):
+        channel_id = bare_channel_id(channel_id)
+        info = self._channels.get(channel_id)
+        if info is None:
+            metrics.inc("channel_lookup_misses_total")
+            info = self._info(channel_id)
+            self._resolve_later(channel_id)
+        return info
+
+    def _resolve_later(self, channel_id):
+        if not self.resolve_unknown or channel_id in self._resolving:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Offline test modes have no event loop; the id-based answer will do
+            return
+        self._resolving.add(channel_id)
+        loop.create_task(self._resolve(channel_id))
+
+    async def _resolve(self, channel_id):
+        try:
+            self.add(await self.client.get_entity(PeerChannel(channel_id)))
+        except Exception as e:
+            log.warning(f"Could not resolve channel {channel_id}: {e}", channel_id=channel_id)
+        finally:
+            self._resolving.discard(channel_id)
+
+    async def run_refresher(self, interval_seconds):
+        # Channels get renamed; re-resolve everything known every interval
+        while True:
+            await asyncio.sleep(interval_seconds)
+            peers = [PeerChannel(channel_id) for channel_id in self._channels]
+            if not peers:
+                continue
+            try:
+                for entity in await self.client.get_entity(peers):
+                    self.add(entity)
+            except Exception as e:
+                log.error(f"Error refreshing channel info: {e}")
@@ -21,7 +21,109 @@ SOURCE_CHANNEL_USERNAMES = [
     "test_channel_osint",
 ]
 
+# Only these channels (פיקוד העורף) may post alerts, and news from them is dropped
+ALERT_AUTHORITY_CHANNEL_IDS = [
+    -1001441886157,
+]
+CHANNEL_INFO_REFRESH_SECONDS = 3600  # How often source channel titles are looked up again
+
+SOURCE_LANGUAGE = "he"  # Language the source channels post in
+
+# Language code -> target channel. The SOURCE_LANGUAGE channel gets the posts
+# as they are; every other channel gets them translated into its language.
 TARGET_CHANNELS = {
     "en": {"id": -1002745106845, "name": "OSINT News - English"},
     "he": {"id": -1002677930861, "name": "OSINT News - Hebrew"}
 }
+
+# --- Translation ---
+
+TRANSLATION_MAX_CONCURRENCY = 4  # Gemini calls allowed in flight at once
+TRANSLATION_TIMEOUT_SECONDS = 20  # Give up on a single translation after this long
+TRANSLATION_CACHE_MEMORY_ENTRIES = 2000  # Most recent translations kept in memory
+# Under load, pending translations are sent to Gemini together in one request
+TRANSLATION_BATCHING = True
+TRANSLATION_BATCH_WINDOW_SECONDS = 0.05  # How long a batch waits for more texts once all slots are busy
+TRANSLATION_BATCH_MAX_ITEMS = 10
+TRANSLATION_BATCH_MAX_CHARS = 6000
+# Backends are tried in this order; ones without an API key in .env are skipped.
+# "stub" is a local no-network backend for testing.
+TRANSLATION_BACKENDS = ["gemini", "deepl"]
+TRANSLATION_HEDGE_PERCENTILE = 0.95  # Ask the next backend too once the primary is slower than this percentile
+TRANSLATION_CIRCUIT_FAILURES = 3  # Consecutive failures before a backend is taken out of rotation
+TRANSLATION_CIRCUIT_COOLDOWN_SECONDS = 60
+
+# --- Deduplication ---
+
+DEDUP_WINDOW_SECONDS = 300  # 5 minutes
+DEDUP_SIMILARITY_THRESHOLD = 0.92  # 92% similar or more is considered duplicate
+DEDUP_SAVE_INTERVAL_SECONDS = 30
+
+# --- State ---
+
+# Watermarks, the dedup window and the translation cache all live here
+STATE_DB_FILE = 'bot_state.db'
+STATE_FLUSH_INTERVAL_SECONDS = 1  # Buffered state writes are committed this often
+
+# --- Catch-up ---
+
+# Messages posted while the bot was down are replayed on startup,
+# except alerts older than this, which are no longer actionable
+CATCHUP_MAX_ALERT_AGE_SECONDS = 600
+
+# --- Pipeline ---
+
+# Worker tasks per stage. Alerts are served before news at every stage.
+PIPELINE_WORKERS = {
+    "ingest": 4,  # media downloads
+    "classify": 2,
+    "dedup": 1,
+    "translate": 8,  # shared by all target languages, which translate side by side
+    "publish": 8,
+}
+PIPELINE_QUEUE_SIZE = 100  # Per stage; a full queue makes the stage before it wait
+PIPELINE_DEPTH_REPORT_SECONDS = 60  # How often non-empty queue depths are printed
+
+# --- Sending ---
+
+# Telegram allows about 20 posts a minute to one channel and 30 messages a second overall
+SEND_CHAT_RATE_PER_MINUTE = 20
+SEND_CHAT_BURST = 10  # Posts a channel can take back to back before pacing kicks in
+SEND_GLOBAL_RATE_PER_SECOND = 30
+SEND_MAX_RETRIES = 5  # For flood waits, timeouts and network errors
+SEND_RETRY_BASE_SECONDS = 1  # Backoff doubles from here, with jitter
+SEND_CONNECTION_POOL_SIZE = 8  # Pooled HTTP connections to the Bot API
+SEND_POOL_TIMEOUT_SECONDS = 10
+
+# --- Media ---
+MEDIA_SPOOL_MAX_BYTES = 20 * 1024 * 1024  # Media is kept in memory up to this size, then spooled to a temp file
+ALBUM_WINDOW_SECONDS = 1.0  # How long to wait for more parts of an album before posting it
+
+# --- Alert coalescing ---
+# Alerts of the same kind within this many seconds of the first one are merged into its post
+ALERT_COALESCE_WINDOW_SECONDS = 60
+ALERT_EDIT_MIN_INTERVAL_SECONDS = 3  # At most one edit of a merged alert post this often
+
+# --- Metrics ---
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464  # Prometheus endpoint at /metrics; None turns it off
+METRICS_JSON_FILE = None  # e.g. "metrics.json" to also dump a JSON snapshot periodically
+METRICS_DUMP_INTERVAL_SECONDS = 60
+
+# --- Sharding ---
+# With more than 1, source channels are split across this many processes, each
+# with its own Telethon session (session_name_shard<N>, log them in once with
+# `python main_bot.py shard_login`), feeding this process, which publishes.
+SHARD_COUNT = 1
+SHARD_QUEUE_SIZE = 200  # Messages in flight from the shards to the publisher
+SHARD_CHECK_INTERVAL_SECONDS = 5  # How often the publisher checks that every shard is still running
+SHARD_MAX_QUICK_RESTARTS = 3  # A shard that exits this many times in a row, each within
+SHARD_MIN_UPTIME_SECONDS = 60  # this long of starting, stops the bot instead of being restarted
+
+# --- Logging ---
+LOG_LEVEL = "INFO"  # "DEBUG" adds a line per received message, rate-limited per source channel
+LOG_JSON = True  # One JSON object per line; False for plain text
+LOG_FILE = None  # e.g. "bot.log" to also write the log to a file
+LOG_QUEUE_SIZE = 10000  # Records waiting for the writer thread; more than this are dropped
+LOG_DEBUG_RATE_PER_SECOND = 5  # Per source channel, after a burst of LOG_DEBUG_BURST
+LOG_DEBUG_BURST = 20
@@ -0,0 +1,160 @@
+import string
+import time
+from collections import Counter, deque
+from difflib import SequenceMatcher
+
+_punctuation_table = str.maketrans('', '', string.punctuation)
+
+def normalize_text(text):
+    # Lowercase, remove punctuation, collapse whitespace
+    text = text.lower()
+    text = text.translate(_punctuation_table)
+    text = ' '.join(text.split())
+    return text
+
+class DedupIndex:
+    """
+    Answers "was something at least `threshold` similar seen in the last
+    `window_seconds`?" without comparing against every recent message.
+
+    Each message is normalized once and reduced to a MinHash signature of
+    its character shingles. The signature is split into LSH bands, and only
+    messages sharing a band bucket are compared with SequenceMatcher, so
+    the similarity test is the same one the bot has always used. Entries
+    leave the buckets in arrival order once they fall out of the window.
+    """
+
+    # One-permutation MinHash: each shingle is hashed once and lands in one
+    # of NUM_HASHES bins, and each bin keeps its smallest value. Python's
+    # str hash is salted per process, which is fine because only normalized
+    # text is persisted (see entries()) and fingerprints are rebuilt on restore.
+    NUM_HASHES = 32
+    BANDS = 16
+    ROWS = NUM_HASHES // BANDS
+    _BIN_BITS = 5
+    _EMPTY = 1 << 64
+
+    def __init__(self, window_seconds=300, threshold=0.92, shingle_size=5):
+        self.window_seconds = window_seconds
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self._entries = {}  # entry id -> (timestamp, normalized text, char counts, band keys)
+        self._buckets = {}  # band key -> set of entry ids
+        self._order = deque()  # entry ids, oldest first
+        self._next_id = 0
+        self.comparisons = 0
+
+    def _signature(self, normalized):
+        size = self.shingle_size
+        if len(normalized) <= size:
+            shingles = {normalized}
+        else:
+            shingles = {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+        num_bins = self.NUM_HASHES
+        bin_mask = num_bins - 1
+        bits = self._BIN_BITS
+        empty = self._EMPTY
+        bins = [empty] * num_bins
+        for shingle in shingles:
+            h = hash(shingle) & 0xFFFFFFFFFFFFFFFF
+            b = h & bin_mask
+            v = h >> bits
+            if v < bins[b]:
+                bins[b] = v
+        # Short texts leave bins empty; borrow from the next filled bin so
+        # empty bins don't all collide with each other
+        if empty in bins:
+            filled = list(bins)
+            for i in range(num_bins):
+                if filled[i] == empty:
+                    for offset in range(1, num_bins):
+                        value = filled[(i + offset) % num_bins]
+                        if value != empty:
+                            bins[i] = value + offset * (1 << 59)
+                            break
+        return bins
+
+    def _band_keys(self, signature):
+        rows = self.ROWS
+        return [(band,) + tuple(signature[band * rows:(band + 1) * rows]) for band in range(self.BANDS)]
+
+    def _evict(self, now):
+        while self._order:
+            entry_id = self._order[0]
+            timestamp, _, _, band_keys = self._entries[entry_id]
+            if now - timestamp < self.window_seconds:
+                break
+            self._order.popleft()
+            del self._entries[entry_id]
+            for key in band_keys:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(entry_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def _fingerprint(self, text):
+        normalized = normalize_text(text)
+        return normalized, Counter(normalized), self._band_keys(self._signature(normalized))
+
+    def _find_similar(self, normalized, counts, band_keys):
+        candidates = set()
+        for key in band_keys:
+            candidates.update(self._buckets.get(key, ()))
+        length = len(normalized)
+        for entry_id in candidates:
+            _, recent, recent_counts, _ = self._entries[entry_id]
+            total = length + len(recent)
+            if not total:
+                return True
+            # Cheap upper bounds on SequenceMatcher.ratio() rule most candidates out
+            if 2.0 * min(length, len(recent)) / total < self.threshold:
+                continue
+            if 2.0 * sum((counts & recent_counts).values()) / total < self.threshold:
+                continue
+            self.comparisons += 1
+            if SequenceMatcher(None, normalized, recent).ratio() >= self.threshold:
+                return True
+        return False
+
+    def _insert(self, normalized, counts, band_keys, timestamp):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (timestamp, normalized, counts, band_keys)
+        self._order.append(entry_id)
+        for key in band_keys:
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def is_duplicate(self, text, now=None):
+        now = time.time() if now is None else now
+        self._evict(now)
+        return self._find_similar(*self._fingerprint(text))
+
+    def add(self, text, now=None):
+        now = time.time() if now is None else now
+        self._insert(*self._fingerprint(text), now)
+
+    def check_and_add(self, text, now=None):
+        """
+        Return True if `text` duplicates a recent message; otherwise
+        remember it and return False. Fingerprints the text only once.
+        """
+        now = time.time() if now is None else now
+        self._evict(now)
+        fingerprint = self._fingerprint(text)
+        if self._find_similar(*fingerprint):
+            return True
+        self._insert(*fingerprint, now)
+        return False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def entries(self):
+        # (timestamp, normalized text) pairs in the window, oldest first
+        return [(self._entries[i][0], self._entries[i][1]) for i in self._order]
+
+    def restore(self, timestamp, normalized):
+        # Re-add an entry saved by entries(); the text is already normalized
+        if time.time() - timestamp < self.window_seconds:
+            self._insert(normalized, Counter(normalized), self._band_keys(self._signature(normalized)), timestamp)
@@ -1,41 +1,53 @@
 import asyncio
-from telethon import TelegramClient, events
+import multiprocessing
+from telethon import TelegramClient, events, utils
 from telegram import Bot
-import json
-import os
+from telegram.request import HTTPXRequest
 import config
-from message_cleaner import clean_message, remove_specific_ad_block
-from translator import translate
-import re
+from message_cleaner import parse_message
+from translator import translate_async
+from alert_templates import render_alert_en, PIKUD_FOOTER_EN
+from dedup import DedupIndex
+from state_store import store
+from pipeline import Pipeline, Job, PRIORITY_ALERT, PRIORITY_NEWS
+from send_scheduler import SendScheduler
+from media_relay import MediaRelay
+from album_aggregator import AlbumAggregator
+from alert_coalescer import AlertCoalescer
+from channel_registry import ChannelRegistry
+from metrics import metrics
+from telegram_html import caption_html
+from structured_log import get_logger, setup_logging_from_config
+from sharding import (
+    ShardChannel, ShardMediaRelay, create_shard_client, partition_channels,
+    receive_from_shards, run_shard, shard_session_name
+)
 import time
-from difflib import SequenceMatcher
-import string
+
+log = get_logger("main_bot")
 
 LAST_MESSAGE_IDS_FILE = 'last_message_ids.json'
 last_message_ids = {}
 
-# Store recent messages for deduplication
-RECENT_MESSAGES = []  # List of dicts: {"text": ..., "timestamp": ...}
-RECENT_WINDOW_SECONDS = 300  # 5 minutes
-SIMILARITY_THRESHOLD = 0.92  # 92% similar or more is considered duplicate
+# Recent messages for deduplication, shared by all source channels
+dedup_index = DedupIndex(config.DEDUP_WINDOW_SECONDS, config.DEDUP_SIMILARITY_THRESHOLD)
 
 def load_last_message_ids():
     global last_message_ids
-    if os.path.exists(LAST_MESSAGE_IDS_FILE):
-        with open(LAST_MESSAGE_IDS_FILE, 'r') as f:
-            try:
-                last_message_ids = json.load(f)
-                last_message_ids = {int(k): v for k, v in last_message_ids.items()}
-            except json.JSONDecodeError:
-                print("last_message_ids.json is empty or corrupted. Starting fresh.")
-                last_message_ids = {}
-    else:
-        print("last_message_ids.json not found. Starting fresh.")
-        last_message_ids = {}
+    # Carry over the watermarks from the old JSON file on first start
+    store.import_json_watermarks(LAST_MESSAGE_IDS_FILE)
+    last_message_ids = store.load_watermarks()
+    if not last_message_ids:
+        log.info("No stored message IDs found. Starting fresh.")
 
-def save_last_message_ids():
-    with open(LAST_MESSAGE_IDS_FILE, 'w') as f:
-        json.dump(last_message_ids, f)
+def mark_processed(channel_id, message_id):
+    # In memory: the highest finished id, so repeats are skipped in this run
+    last_message_ids[channel_id] = max(message_id, last_message_ids.get(channel_id, 0))
+    # Stored: never past a message still in flight, so catch-up after a restart picks it up
+    pending = in_flight.get(channel_id)
+    watermark = min(pending) - 1 if pending else last_message_ids[channel_id]
+    # Buffered; the state store commits it on its next flush
+    store.set_watermark(channel_id, watermark)
 
 if not isinstance(config.TELEGRAM_BOT_TOKEN, str) or not config.TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN must be a non-empty string in config.py")
@@ -44,235 +56,572 @@ if not isinstance(config.TELETHON_API_ID, int) or config.TELETHON_API_ID is None
 if not isinstance(config.TELETHON_API_HASH, str) or not config.TELETHON_API_HASH:
     raise ValueError("TELETHON_API_HASH must be a non-empty string in config.py")
 
-telegram_bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
+# One pooled HTTP client for all Bot API calls, so concurrent sends don't queue for a single connection
+telegram_bot = Bot(
+    token=config.TELEGRAM_BOT_TOKEN,
+    request=HTTPXRequest(
+        connection_pool_size=config.SEND_CONNECTION_POOL_SIZE,
+        pool_timeout=config.SEND_POOL_TIMEOUT_SECONDS
+    )
+)
+send_scheduler = SendScheduler(
+    telegram_bot,
+    chat_rate_per_minute=config.SEND_CHAT_RATE_PER_MINUTE,
+    chat_burst=config.SEND_CHAT_BURST,
+    global_rate_per_second=config.SEND_GLOBAL_RATE_PER_SECOND,
+    max_retries=config.SEND_MAX_RETRIES,
+    retry_base_seconds=config.SEND_RETRY_BASE_SECONDS
+)
 telethon_client = TelegramClient('session_name', config.TELETHON_API_ID, config.TELETHON_API_HASH)
+channel_registry = ChannelRegistry(telethon_client, authority_ids=config.ALERT_AUTHORITY_CHANNEL_IDS)
+media_relay = MediaRelay(telethon_client, spool_max_bytes=config.MEDIA_SPOOL_MAX_BYTES)
 
-def markdown_to_telegram_html(text):
-    # Bold: **text** or __text__ -> <b>text</b>
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
-    # Italic: *text* or _text_ -> <i>text</i>
-    text = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'<i>\1</i>', text)
-    text = re.sub(r'(?<!_)_(?!_)(.+?)(?<!_)_(?!_)', r'<i>\1</i>', text)
-    # Links: [text](url) -> <a href="url">text</a>
-    text = re.sub(r'\[(.+?)\]\((https?://[^\s]+)\)', r'<a href="\2">\1</a>', text)
-    return text
-
-def normalize_text(text):
-    # Lowercase, remove punctuation, collapse whitespace
-    text = text.lower()
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    text = ' '.join(text.split())
-    return text
-
-def is_similar_to_recent(text):
-    now = time.time()
-    # Remove old messages from RECENT_MESSAGES
-    global RECENT_MESSAGES
-    RECENT_MESSAGES = [msg for msg in RECENT_MESSAGES if now - msg["timestamp"] < RECENT_WINDOW_SECONDS]
-    norm_text = normalize_text(text)
-    for msg in RECENT_MESSAGES:
-        norm_recent = normalize_text(msg["text"])
-        similarity = SequenceMatcher(None, norm_text, norm_recent).ratio()
-        if similarity >= SIMILARITY_THRESHOLD:
-            return True
-    return False
+async def persist_dedup_window():
+    # Snapshot the dedup window now and then so a restart doesn't repost recent news
+    while True:
+        await asyncio.sleep(config.DEDUP_SAVE_INTERVAL_SECONDS)
+        store.save_dedup_window(dedup_index.entries())
 
-def extract_red_alert_summary(text):
-    import re
-    # Detect if this is a Red Alert message
-    if "צבע אדום" not in text:
-        return None
-    # Extract date/time
-    date_time_match = re.search(r"(\d{2}/\d{2}/\d{4})\s*-\s*(\d{2}:\d{2})", text)
-    date_time = f"{date_time_match.group(1)} {date_time_match.group(2)}" if date_time_match else ""
-    # Extract main regions (lines starting with • and ending with colon)
-    regions = re.findall(r"•\s*([^:]+):", text)
-    regions_str = ", ".join(regions) if regions else "אזורים לא ידועים"
-    # Extract instruction (look for 'היכנסו למרחב המוגן' or similar)
-    instruction_match = re.search(r"היכנסו למרחב המוגן[^\n]*", text)
-    instruction = instruction_match.group(0) if instruction_match else ""
-    # Build summary
-    summary = f"🚨 צבע אדום (Red Alert){' - ' + date_time if date_time else ''}\nאזורים עיקריים: {regions_str}"
-    if instruction:
-        summary += f"\n{instruction}"
-    return summary
+PIKUD_FOOTER = "הודעה זו התקבלה מפיקוד העורף"
+
+def with_pikud_footer(text, add_pikud_footer):
+    return text + "\n\n" + PIKUD_FOOTER if add_pikud_footer else text
+
+async def text_for_target(lang, alert, cleaned_text, add_pikud_footer):
+    """
+    The post text for the `lang` target channel: the source text itself,
+    or its translation.
+    """
+    if lang == config.SOURCE_LANGUAGE:
+        return with_pikud_footer(cleaned_text, add_pikud_footer)
+    # English alerts are rendered from templates; only free text goes to the translator
+    if alert and lang == "en":
+        english = await render_alert_en(alert, translate_async)
+        return english + "\n\n" + PIKUD_FOOTER_EN if add_pikud_footer else english
+    text = with_pikud_footer(cleaned_text, add_pikud_footer)
+    return await translate_async(text, from_lang=config.SOURCE_LANGUAGE, to_lang=lang)
+
+def build_caption(lang, text, channel_name):
+    header = "News:" if lang == config.SOURCE_LANGUAGE else f"News ({lang.upper()}):"
+    return caption_html(header, text, channel_name)
+
+def get_channel_id(message):
+    return message.peer_id.channel_id if hasattr(message.peer_id, 'channel_id') else None
+
+# Processing is split into stages connected by bounded priority queues:
+# ingest -> classify -> dedup, then one branch per target channel:
+# publish for the source language, translate -> publish for the others
+pipeline = Pipeline(config.PIPELINE_QUEUE_SIZE)
+
+# channel_id -> ids of messages queued or in flight (album parts waiting in
+# the aggregator included), so a message seen both by catch-up and by a live
+# event is only processed once, and the stored watermark stays below them
+in_flight = {}
 
 @telethon_client.on(events.NewMessage(chats=config.SOURCE_CHANNEL_ENTITIES))
 async def handle_new_source_message(event):
     message = event.message
-    channel_id = message.peer_id.channel_id if hasattr(message.peer_id, 'channel_id') else None
-    print(f"Received message from channel_id: {channel_id}")  # Debug print
+    # Hold live messages until the channel's backlog has been queued, so posts stay in order
+    catchup_gate = catchup_done.get(get_channel_id(message))
+    if catchup_gate:
+        await catchup_gate.wait()
+    await submit_message(message)
+
+async def submit_message(message, catching_up=False):
+    """
+    Queue a source message for processing. Waits while the pipeline is full.
+    Album parts are held back until the whole album has arrived.
+    """
+    channel_id = get_channel_id(message)
+    # Debug records are rate-limited per channel, so a busy channel can't flood the log
+    log.debug(f"Received message from channel_id: {channel_id}", channel_id=channel_id, message_id=message.id, catching_up=catching_up)
+    metrics.inc("messages_received_total", catching_up=catching_up)
     if not channel_id:
-        print(f"Skipping message from unknown peer type: {type(message.peer_id).__name__}")
+        log.info(
+            f"Skipping message from unknown peer type: {type(message.peer_id).__name__}",
+            message_id=message.id, decision="unknown_peer"
+        )
+        metrics.inc("skipped_total", reason="unknown_peer")
         return
-    if channel_id in last_message_ids and message.id <= last_message_ids[channel_id]:
-        print(f"Skipping already processed message {message.id}")
+    # Checked on arrival, before a later message can move the watermark past a waiting album part
+    if not should_queue(channel_id, message):
         return
-    original_text = message.text
-    print(f"Original text: {original_text}")  # Debug print
-    media_file_path = None
-    downloads_dir = 'downloads'
-    os.makedirs(downloads_dir, exist_ok=True)
-    if message.photo:
-        media_file_path = os.path.join(downloads_dir, f"photo_{message.id}.jpg")
-        try:
-            await message.download_media(file=media_file_path)
-        except Exception as e:
-            print(f"Error downloading photo: {e}")
-            media_file_path = None
-    elif message.video:
-        media_file_path = os.path.join(downloads_dir, f"video_{message.id}.mp4")
-        try:
-            await message.download_media(file=media_file_path)
-        except Exception as e:
-            print(f"Error downloading video: {e}")
-            media_file_path = None
-    if not original_text and not media_file_path:
-        last_message_ids[channel_id] = message.id
-        save_last_message_ids()
+    in_flight.setdefault(channel_id, set()).add(message.id)
+    if message.grouped_id:
+        await album_aggregator.add((channel_id, message.grouped_id), message, catching_up)
         return
-    # Only allow alerts from פיקוד העורף, and only allow news from other channels
-    pikud_haoref_id = -1001441886157
-    is_pikud_haoref = (channel_id == pikud_haoref_id)
-    cleaned_alert = clean_message(original_text if original_text else "")
-    is_alert = cleaned_alert != remove_specific_ad_block(original_text)
+    await queue_job(channel_id, [message], catching_up)
+
+async def submit_album(messages, catching_up=False):
+    channel_id = get_channel_id(messages[0])
+    parts = sorted(messages, key=lambda m: m.id)
+    log.debug(f"Collected album of {len(parts)} parts from channel_id: {channel_id}", channel_id=channel_id, message_id=parts[0].id)
+    await queue_job(channel_id, parts, catching_up)
+
+album_aggregator = AlbumAggregator(submit_album, window_seconds=config.ALBUM_WINDOW_SECONDS)
+
+def should_queue(channel_id, message):
+    if channel_id in last_message_ids and message.id <= last_message_ids[channel_id]:
+        log.debug(f"Skipping already processed message {message.id}", channel_id=channel_id, message_id=message.id, decision="already_processed")
+        metrics.inc("skipped_total", reason="already_processed")
+        return False
+    if message.id in in_flight.get(channel_id, ()):
+        log.debug(f"Skipping message {message.id}, already queued", channel_id=channel_id, message_id=message.id, decision="already_queued")
+        metrics.inc("skipped_total", reason="already_queued")
+        return False
+    return True
+
+async def queue_job(channel_id, parts, catching_up):
+    # An album's caption is on whichever part has text, usually the first
+    message = next((part for part in parts if part.text), parts[0])
+    original_text = message.text
+    log.debug("Original text", channel_id=channel_id, message_id=message.id, text=original_text)
+    # Parsing is cheap and decides whether the message goes in the alert lane
+    # Shard processes hand over messages they have already parsed
+    parsed = getattr(message, "parsed", None)
+    if parsed is None:
+        with metrics.span("parse_seconds"):
+            parsed = parse_message(original_text if original_text else "", channel_id)
+    priority = PRIORITY_ALERT if parsed.is_alert else PRIORITY_NEWS
+    job = Job(
+        message, priority,
+        channel_id=channel_id,
+        parts=parts,
+        parsed=parsed,
+        catching_up=catching_up,
+        media=[],
+        burst=None,
+        media_lock=asyncio.Lock(),
+        media_uploaded=None,
+        open_branches=0,
+    )
+    await pipeline.put("ingest", job)
+
+def finish_job(job):
+    # Only release the media after every target's send
+    for media in job.media:
+        media.close()
+    pending = in_flight.get(job.channel_id, set())
+    for part in job.parts:
+        pending.discard(part.id)
+        mark_processed(job.channel_id, part.id)
+    if not pending:
+        in_flight.pop(job.channel_id, None)
+    if job.burst:
+        alert_coalescer.first_post_done(job.burst)
+
+def job_fields(job):
+    return {"channel_id": job.channel_id, "message_id": job.message.id, "kind": job.parsed.kind}
+
+def skip_job(job, reason, description):
+    log.info(description, decision=reason, **job_fields(job))
+    metrics.inc("skipped_total", reason=reason)
+    finish_job(job)
+    return None
+
+async def ingest_stage(job):
+    channel_id = job.channel_id
     # If the message is just an ad (fully removed), skip sending and skip media
-    ad_only = cleaned_alert.strip() == ''
-    if ad_only:
-        print(f"Skipping ad-only message (and media) from channel_id: {channel_id}")
-        last_message_ids[channel_id] = message.id
-        save_last_message_ids()
-        return
-    if is_pikud_haoref:
-        if not is_alert:
-            print(f"Skipping non-alert from פיקוד העורף: {channel_id}")
-            last_message_ids[channel_id] = message.id
-            save_last_message_ids()
-            return
+    if job.parsed.kind == "ad-only":
+        return skip_job(job, "ad_only", f"Skipping ad-only message (and media) from channel_id: {channel_id}")
+    with metrics.span("download_seconds"):
+        fetched = await asyncio.gather(*(media_relay.fetch(part) for part in job.parts))
+    job.media = [media for media in fetched if media]
+    return "classify"
+
+async def classify_stage(job):
+    message = job.message
+    channel_id = job.channel_id
+    parsed = job.parsed
+    channel = channel_registry.get(channel_id)
+    # Only allow alerts from פיקוד העורף, and only allow news from other channels
+    if channel.is_alert_authority:
+        if not parsed.is_alert:
+            return skip_job(job, "non_alert_from_authority", f"Skipping non-alert from פיקוד העורף: {channel_id}")
     else:
-        if is_alert:
-            print(f"Skipping alert from non-authoritative channel: {channel_id}")
-            last_message_ids[channel_id] = message.id
-            save_last_message_ids()
-            return
-    cleaned_text = cleaned_alert.strip()
+        if parsed.is_alert:
+            return skip_job(job, "non_authoritative_alert", f"Skipping alert from non-authoritative channel: {channel_id}")
+    if job.catching_up and parsed.is_alert:
+        age = time.time() - message.date.timestamp()
+        if age > config.CATCHUP_MAX_ALERT_AGE_SECONDS:
+            return skip_job(job, "stale_alert", f"Skipping stale alert {message.id} ({int(age)}s old) during catch-up")
+    cleaned_text = parsed.body
 
-    # Convert cleaned_text and translated_text from Markdown to Telegram HTML
-    cleaned_text_html = markdown_to_telegram_html(cleaned_text) if cleaned_text else ""
+    job.cleaned_text = cleaned_text
+    job.channel_name = channel.title
+    job.is_pikud_haoref = channel.is_pikud_haoref
+    return "dedup"
 
-    # Get channel name for footer (move this up before sending)
-    try:
-        entity = await telethon_client.get_entity(channel_id)
-        channel_name = getattr(entity, 'title', None) or getattr(entity, 'username', None) or str(channel_id)
-    except Exception:
-        channel_name = str(channel_id)
-
-    # Add פיקוד העורף footer if relevant
-    pikud_haoref_ids = {-1001441886157}
-    pikud_haoref_names = {"פיקוד העורף", "Home Front Command"}
-    is_pikud_haoref = (channel_id in pikud_haoref_ids) or (str(channel_name).strip() in pikud_haoref_names)
-    pikud_footer = "\n\nהודעה זו התקבלה מפיקוד העורף"
-    cleaned_text_with_footer = cleaned_text + pikud_footer if is_pikud_haoref else cleaned_text
-    cleaned_text_html = markdown_to_telegram_html(cleaned_text_with_footer) if cleaned_text_with_footer else ""
-
-    final_caption = f"<b>News:</b>\n{cleaned_text_html}\n\n(<i>{channel_name}</i>)"
-
-    # Send Hebrew message immediately
-    hebrew_media_sent = False
-    target_channel_info_he = config.TARGET_CHANNELS["he"]
-    target_channel_id_he = target_channel_info_he["id"]
+async def dedup_stage(job):
+    # Alerts repeat legitimately (same areas, a minute apart), so only news is deduplicated
+    if not job.parsed.is_alert and dedup_index.check_and_add(job.cleaned_text):
+        return skip_job(job, "duplicate", f"Skipping duplicate of a recent message from channel_id: {job.channel_id}")
+    if job.parsed.is_alert and not job.media:
+        burst, is_new = alert_coalescer.add(job.channel_id, job.parsed.alert, context=job)
+        if not is_new:
+            return skip_job(job, "merged_alert", f"Merged {job.parsed.kind} alert into the post already sent for this burst")
+        # Only the burst's first alert owns it; finish_job reports how its post went
+        job.burst = burst
+    # Each target channel is a branch of its own, so one slow translation
+    # only holds up the post in its own language
+    branches = target_branches(job)
+    job.open_branches = len(branches)
+    for branch in branches:
+        await pipeline.put("publish" if branch.text is not None else "translate", branch)
+    return None
+
+def target_branches(job):
+    branches = []
+    for lang, target in config.TARGET_CHANNELS.items():
+        branch = Job(
+            job.message, job.priority,
+            job=job,
+            lang=lang,
+            chat_id=target["id"],
+            # Translated branches get their text in the translate stage
+            text=with_pikud_footer(job.cleaned_text, job.is_pikud_haoref) if lang == config.SOURCE_LANGUAGE else None,
+        )
+        # Time spent in the branches counts towards the source message's stages
+        branch.stage_times = job.stage_times
+        branches.append(branch)
+    return branches
+
+async def send_media(media, chat_id, caption):
+    if len(media) == 1:
+        sent = await send_scheduler.send(
+            media[0].send_method,
+            chat_id,
+            caption=caption,
+            parse_mode="HTML",
+            **{media[0].kind: media[0].input_file()}
+        )
+        media[0].remember(sent)
+        return
+    # Albums go out as one media group; Telegram shows the first item's caption for the whole album
+    sent = await send_scheduler.send(
+        "send_media_group",
+        chat_id,
+        media=[item.input_media(caption if i == 0 else None) for i, item in enumerate(media)]
+    )
+    for item, sent_message in zip(media, sent):
+        item.remember(sent_message)
+
+def close_branch(job):
+    job.open_branches -= 1
+    if job.open_branches == 0:
+        finish_job(job)
+
+def record_published(job, target):
+    # Lag from the source post's timestamp to our copy of it going out
+    log.info(f"Published to {target} channel", decision="published", target=target, **job_fields(job))
+    metrics.inc("published_total", target=target, kind=job.parsed.kind)
+    metrics.observe("publish_lag_seconds", time.time() - job.message.date.timestamp(), target=target)
+
+async def publish_media(job, chat_id, caption):
+    """
+    Send the job's media to one target. The first target uploads it and the
+    others wait for that, then send it by file_id without uploading it
+    again. Returns False if the upload failed, in which case the other
+    targets post just the text.
+    """
+    async with job.media_lock:
+        if job.media_uploaded is None:
+            job.media_uploaded = False
+            await send_media(job.media, chat_id, caption)
+            job.media_uploaded = True
+            return True
+    if not job.media_uploaded:
+        return False
+    await send_media(job.media, chat_id, caption)
+    return True
+
+async def translate_stage(branch):
+    job = branch.job
+    if job.cleaned_text:
+        try:
+            branch.text = await text_for_target(branch.lang, job.parsed.alert, job.cleaned_text, job.is_pikud_haoref)
+            metrics.inc("translations_total", outcome="ok", target=branch.lang)
+        except asyncio.TimeoutError:
+            log.warning(
+                f"Translation to {branch.lang} timed out after {config.TRANSLATION_TIMEOUT_SECONDS}s",
+                target=branch.lang, **job_fields(job)
+            )
+            metrics.inc("translations_total", outcome="timeout", target=branch.lang)
+        except Exception as e:
+            log.error(f"Translation error ({branch.lang}): {e}", target=branch.lang, **job_fields(job))
+            metrics.inc("translations_total", outcome="error", target=branch.lang)
+    if not branch.text:
+        if job.burst:
+            alert_coalescer.record_failure(job.burst, branch.lang)
+        close_branch(job)
+        return None
+    return "publish"
+
+async def publish_stage(branch):
+    job = branch.job
+    caption = build_caption(branch.lang, branch.text, job.channel_name)
     try:
-        if media_file_path:
-            with open(media_file_path, 'rb') as f:
-                if message.photo:
-                    await telegram_bot.send_photo(
-                        chat_id=target_channel_id_he,
-                        photo=f,
-                        caption=final_caption,
-                        parse_mode="HTML"
-                    )
-                    hebrew_media_sent = True
-                elif message.video:
-                    await telegram_bot.send_video(
-                        chat_id=target_channel_id_he,
-                        video=f,
-                        caption=final_caption,
-                        parse_mode="HTML"
-                    )
-                    hebrew_media_sent = True
-        elif cleaned_text.strip():
-            await telegram_bot.send_message(
-                chat_id=target_channel_id_he,
-                text=final_caption,
+        if job.media and await publish_media(job, branch.chat_id, caption):
+            record_published(job, branch.lang)
+        elif branch.text.strip():
+            sent = await send_scheduler.send(
+                "send_message",
+                branch.chat_id,
+                text=caption,
                 parse_mode="HTML"
             )
+            if job.burst:
+                alert_coalescer.record_post(job.burst, branch.lang, branch.chat_id, sent.message_id)
+            record_published(job, branch.lang)
     except Exception as e:
-        print(f"Error forwarding message to Hebrew channel: {e}")
+        log.error(f"Error forwarding message to {branch.lang} channel: {e}", target=branch.lang, **job_fields(job))
+    finally:
+        if job.burst and branch.lang not in job.burst.posts:
+            alert_coalescer.record_failure(job.burst, branch.lang)
+        close_branch(job)
+    return None
 
-    # Translate and send to English channel (if translation is available)
-    translated_text = ""
-    translated_text_html = ""
-    if cleaned_text:
+async def edit_alert_posts(burst, targets):
+    # Re-render the merged alert so the existing posts list every area so far
+    first_job = burst.context
+
+    async def edit(target):
+        chat_id, message_id = burst.posts[target]
         try:
-            translated_text = translate(cleaned_text_with_footer, from_lang="he", to_lang="en") if is_pikud_haoref else translate(cleaned_text, from_lang="he", to_lang="en")
-            translated_text_html = markdown_to_telegram_html(translated_text) if translated_text else ""
+            text = await text_for_target(target, burst.alert, burst.alert.render(), first_job.is_pikud_haoref)
+            await send_scheduler.send(
+                "edit_message_text",
+                chat_id,
+                message_id=message_id,
+                text=build_caption(target, text, first_job.channel_name),
+                parse_mode="HTML"
+            )
         except Exception as e:
-            print(f"Translation error: {e}")
-            translated_text = ""
-            translated_text_html = ""
-
-    if translated_text:
-        target_channel_info_en = config.TARGET_CHANNELS["en"]
-        target_channel_id_en = target_channel_info_en["id"]
-        final_caption_en = f"<b>News (EN):</b>\n{translated_text_html}\n\n(<i>{channel_name}</i>)"
+            log.error(f"Error editing alert post in {target} channel: {e}", target=target, kind=burst.alert.kind)
+
+    await asyncio.gather(*(edit(target) for target in targets))
+
+async def post_alert(burst, targets):
+    # A new post of the merged alert, for targets the burst's first post didn't reach
+    first_job = burst.context
+    version = burst.version
+
+    async def post(target):
+        chat_id = config.TARGET_CHANNELS[target]["id"]
         try:
-            if media_file_path and hebrew_media_sent:
-                with open(media_file_path, 'rb') as f:
-                    if message.photo:
-                        await telegram_bot.send_photo(
-                            chat_id=target_channel_id_en,
-                            photo=f,
-                            caption=final_caption_en,
-                            parse_mode="HTML"
-                        )
-                    elif message.video:
-                        await telegram_bot.send_video(
-                            chat_id=target_channel_id_en,
-                            video=f,
-                            caption=final_caption_en,
-                            parse_mode="HTML"
-                        )
-            else:
-                await telegram_bot.send_message(
-                    chat_id=target_channel_id_en,
-                    text=final_caption_en,
-                    parse_mode="HTML"
-                )
+            text = await text_for_target(target, burst.alert, burst.alert.render(), first_job.is_pikud_haoref)
+            sent = await send_scheduler.send(
+                "send_message",
+                chat_id,
+                text=build_caption(target, text, first_job.channel_name),
+                parse_mode="HTML"
+            )
         except Exception as e:
-            print(f"Error forwarding message to English channel: {e}")
+            log.error(f"Error posting alert to {target} channel: {e}", target=target, kind=burst.alert.kind)
+            alert_coalescer.record_failure(burst, target, version)
+            return
+        alert_coalescer.record_post(burst, target, chat_id, sent.message_id, version)
+        record_published(first_job, target)
+
+    await asyncio.gather(*(post(target) for target in targets))
+
+alert_coalescer = AlertCoalescer(
+    edit_alert_posts,
+    post_alert,
+    window_seconds=config.ALERT_COALESCE_WINDOW_SECONDS,
+    min_edit_interval_seconds=config.ALERT_EDIT_MIN_INTERVAL_SECONDS
+)
+
+def drop_failed_job(job, stage):
+    # A stage raised; close the branch or job, so its ids leave in_flight and the watermark moves on
+    if hasattr(job, "job"):
+        close_branch(job.job)
+    elif not job.open_branches:
+        finish_job(job)
+
+pipeline.on_error = drop_failed_job
+pipeline.add_stage("ingest", ingest_stage, config.PIPELINE_WORKERS["ingest"])
+pipeline.add_stage("classify", classify_stage, config.PIPELINE_WORKERS["classify"])
+pipeline.add_stage("dedup", dedup_stage, config.PIPELINE_WORKERS["dedup"])
+pipeline.add_stage("translate", translate_stage, config.PIPELINE_WORKERS["translate"])
+pipeline.add_stage("publish", publish_stage, config.PIPELINE_WORKERS["publish"])
+
+# channel_id -> asyncio.Event, set once that channel's backlog has been processed
+catchup_done = {}
+
+async def catch_up_channel(channel):
+    """
+    Queue everything posted to `channel` after its stored watermark, oldest
+    first, into the same pipeline as live messages.
+    """
+    try:
+        entity = await telethon_client.get_entity(channel)
+    except Exception as e:
+        log.warning(f"Could not resolve {channel} for catch-up: {e}")
+        return 0
+    watermark = last_message_ids.get(entity.id)
+    if watermark is None:
+        # Never seen this channel before; start from live messages instead of its whole history
+        return 0
+    queued = 0
+    try:
+        # Fetched in pages of 100 per request
+        async for message in telethon_client.iter_messages(entity, min_id=watermark, reverse=True, wait_time=0):
+            await submit_message(message, catching_up=True)
+            queued += 1
+    except Exception as e:
+        # E.g. a long FloodWaitError; the rest of the backlog is skipped, but live mode still starts
+        log.error(f"Catch-up of {channel} stopped after {queued} messages: {e}", channel_id=entity.id)
+        metrics.inc("catchup_errors_total")
+    return queued
+
+async def catch_up():
+    start = time.monotonic()
 
-    # Only delete the media file after both sends
-    if media_file_path and os.path.exists(media_file_path):
+    async def run(channel, channel_id):
         try:
-            os.remove(media_file_path)
-        except Exception as e:
-            print(f"Error removing media file: {e}")
+            return await catch_up_channel(channel)
+        finally:
+            catchup_done[channel_id].set()
+
+    # Channels are independent, so their backlogs are replayed concurrently
+    counts = await asyncio.gather(*(run(channel, channel_id) for channel, channel_id in catchup_channels()))
+    log.info(f"Queued {sum(counts)} missed messages in {time.monotonic() - start:.1f}s")
+
+def catchup_channels():
+    # (config entry, bare channel id as seen in message.peer_id) pairs
+    channels = []
+    for marked_id in config.SOURCE_CHANNEL_ENTITIES:
+        channel_id, _ = utils.resolve_id(marked_id)
+        channels.append((marked_id, channel_id))
+    return channels
+
+async def run_single_process():
+    for _, channel_id in catchup_channels():
+        catchup_done[channel_id] = asyncio.Event()
+    log.info("Authenticating Telethon client...")
+    await telethon_client.start()
+    log.info("Telethon client connected.")
+    await channel_registry.preload(config.SOURCE_CHANNEL_ENTITIES + config.SOURCE_CHANNEL_USERNAMES)
+    refresher = asyncio.create_task(channel_registry.run_refresher(config.CHANNEL_INFO_REFRESH_SECONDS))
+    try:
+        log.info("Catching up on messages posted while the bot was down...")
+        await catch_up()
+        log.info("Bot is listening for new messages in configured source channels...")
+        await telethon_client.run_until_disconnected()
+    finally:
+        refresher.cancel()
+
+def start_shard(context, index, channels, shard_queue):
+    # Catches up from the current watermarks, so a restarted shard fills the gap it left
+    process = context.Process(
+        target=run_shard,
+        args=(index, channels, shard_queue, dict(last_message_ids)),
+        name=f"shard-{index}",
+        daemon=True
+    )
+    process.start()
+    return process
+
+async def watch_shards(context, shards, shard_queue, processes):
+    """
+    Restart shard processes that exit. Raises once a shard has exited
+    SHARD_MAX_QUICK_RESTARTS times in a row soon after starting (e.g. its
+    session isn't logged in), which stops the bot.
+    """
+    started_at = [time.monotonic()] * len(processes)
+    quick_exits = [0] * len(processes)
+    while True:
+        await asyncio.sleep(config.SHARD_CHECK_INTERVAL_SECONDS)
+        for index, process in enumerate(processes):
+            if process.is_alive():
+                continue
+            log.error(f"Shard {index} exited with code {process.exitcode}", shard=index, exit_code=process.exitcode)
+            metrics.inc("shard_exits_total", shard=index)
+            if time.monotonic() - started_at[index] < config.SHARD_MIN_UPTIME_SECONDS:
+                quick_exits[index] += 1
+            else:
+                quick_exits[index] = 1
+            if quick_exits[index] > config.SHARD_MAX_QUICK_RESTARTS:
+                raise RuntimeError(
+                    f"Shard {index} exited {quick_exits[index]} times in a row soon after starting, "
+                    f"check its session with `python main_bot.py shard_login`"
+                )
+            processes[index] = start_shard(context, index, shards[index], shard_queue)
+            started_at[index] = time.monotonic()
+
+async def run_sharded(shard_count):
+    """
+    Split the source channels across shard processes, each with its own
+    Telethon session, and publish what they send from this process, which
+    owns dedup, coalescing, translation and the send limits.
+    """
+    global media_relay
+    media_relay = ShardMediaRelay(spool_max_bytes=config.MEDIA_SPOOL_MAX_BYTES)
+    # This process's Telethon client is never started; the shards send channel titles instead
+    channel_registry.resolve_unknown = False
+    context = multiprocessing.get_context("spawn")
+    shard_queue = context.Queue(maxsize=config.SHARD_QUEUE_SIZE)
+    shards = partition_channels(config.SOURCE_CHANNEL_ENTITIES, shard_count)
+    processes = [start_shard(context, index, channels, shard_queue) for index, channels in enumerate(shards)]
+    log.info(f"Started {len(processes)} shard processes, listening for their messages...")
 
-    last_message_ids[channel_id] = message.id
-    save_last_message_ids()
+    async def receive():
+        async for item in receive_from_shards(shard_queue):
+            if isinstance(item, ShardChannel):
+                channel_registry.add(item)
+            else:
+                await submit_message(item, catching_up=item.catching_up)
+
+    tasks = [
+        asyncio.create_task(receive()),
+        asyncio.create_task(watch_shards(context, shards, shard_queue, processes)),
+    ]
+    try:
+        # Neither returns on its own; whichever fails first stops the bot
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        for process in processes:
+            process.terminate()
 
 async def main():
-    print("Loading last processed message IDs...")
+    log.info("Loading last processed message IDs...")
     load_last_message_ids()
-    print("Authenticating Telethon client...")
-    await telethon_client.start()
-    print("Telethon client connected.")
-    print("Bot is listening for new messages in configured source channels...")
-    await telethon_client.run_until_disconnected()
+    for timestamp, text in store.load_dedup_window():
+        dedup_index.restore(timestamp, text)
+    log.info(f"Restored {len(dedup_index)} recent messages for deduplication.")
+    pipeline.start()
+    background_tasks = [
+        asyncio.create_task(store.run_flusher(config.STATE_FLUSH_INTERVAL_SECONDS)),
+        asyncio.create_task(persist_dedup_window()),
+        asyncio.create_task(pipeline.report_depths(config.PIPELINE_DEPTH_REPORT_SECONDS)),
+    ]
+    if config.METRICS_PORT:
+        background_tasks.append(asyncio.create_task(metrics.serve(config.METRICS_HOST, config.METRICS_PORT)))
+    if config.METRICS_JSON_FILE:
+        background_tasks.append(asyncio.create_task(
+            metrics.run_json_dump(config.METRICS_JSON_FILE, config.METRICS_DUMP_INTERVAL_SECONDS)
+        ))
+    try:
+        if config.SHARD_COUNT > 1:
+            await run_sharded(config.SHARD_COUNT)
+        else:
+            await run_single_process()
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        album_aggregator.close()
+        await pipeline.stop()
+        store.save_dedup_window(dedup_index.entries())
+        store.close()
 
 if __name__ == '__main__':
     import sys
+    setup_logging_from_config()
     if len(sys.argv) > 1 and sys.argv[1] == 'dedup_test':
         print("Deduplication test mode. Type messages, Ctrl+D to end.")
         try:
@@ -284,19 +633,26 @@ if __name__ == '__main__':
                 msg = msg.strip()
                 if not msg:
                     continue
-                if is_similar_to_recent(msg):
+                if dedup_index.check_and_add(msg):
                     print("[SKIPPED] Similar to recent message.")
                 else:
                     print("[SENT] Message accepted.")
-                    RECENT_MESSAGES.append({"text": msg, "timestamp": time.time()})
         except KeyboardInterrupt:
             print("\nTest ended by user.")
         sys.exit(0)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'shard_login':
+        # Shard processes can't prompt for a login code, so log their sessions in up front
+        async def login_shards():
+            for index in range(config.SHARD_COUNT):
+                print(f"Logging in {shard_session_name(index)}...")
+                client = create_shard_client(index)
+                await client.start()
+                await client.disconnect()
+        asyncio.run(login_shards())
+        sys.exit(0)
     elif len(sys.argv) > 1 and sys.argv[1] == 'full_test':
         # Full bot logic test mode (loop)
         import sys
-        import config
-        from message_cleaner import clean_message, remove_specific_ad_block
         channel_map = {}
         for idx, cid in enumerate(config.SOURCE_CHANNEL_ENTITIES):
             name = None
@@ -317,20 +673,19 @@ if __name__ == '__main__':
                 print(f"\nPaste your test message for {channel_name or channel_id} (end with Ctrl+D):")
                 input_text = sys.stdin.read()
                 print("\n--- Original ---\n" + input_text)
-                # Deduplication check
-                if is_similar_to_recent(input_text):
+                # Alert logic (same as in handler)
+                is_pikud_haoref = channel_registry.get(channel_id).is_alert_authority
+                parsed = parse_message(input_text, channel_id)
+                cleaned_alert = parsed.body
+                is_alert = parsed.is_alert
+                # Deduplication check (news only, same as in handler)
+                if not is_alert and dedup_index.is_duplicate(cleaned_alert):
                     print("\n[SKIPPED] Similar to recent message (deduplication). Would NOT be sent.")
                     continue
-                # Alert logic (same as in handler)
-                pikud_haoref_id = -1001441886157
-                is_pikud_haoref = (channel_id == pikud_haoref_id)
-                cleaned_alert = clean_message(input_text)
-                is_alert = cleaned_alert != remove_specific_ad_block(input_text)
                 if is_pikud_haoref:
                     if is_alert:
                         print("\n[SENT] This alert WOULD be sent (פיקוד העורף, alert type).\n")
                         print("--- After cleaning ---\n" + cleaned_alert)
-                        RECENT_MESSAGES.append({"text": input_text, "timestamp": time.time()})
                     else:
                         print("\n[SKIPPED] Not an alert (פיקוד העורף, but not alert type). Would NOT be sent.")
                 else:
@@ -339,13 +694,13 @@ if __name__ == '__main__':
                     else:
                         print("\n[SENT] This news WOULD be sent (regular news from other channel).\n")
                         print("--- After cleaning ---\n" + cleaned_alert)
-                        RECENT_MESSAGES.append({"text": input_text, "timestamp": time.time()})
+                        dedup_index.add(cleaned_alert)
         except KeyboardInterrupt:
             print("\nTest ended by user.")
         sys.exit(0)
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("Bot stopped by user (KeyboardInterrupt).")
+        log.info("Bot stopped by user (KeyboardInterrupt).")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        log.exception(f"An unexpected error occurred: {e}")
@@ -0,0 +1,84 @@
+import tempfile
+from telegram import InputFile, InputMediaPhoto, InputMediaVideo
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+class RelayedMedia:
+    """
+    A photo or video from a source message, held in memory (or in a
+    temporary file once it grows past the spool threshold). The first
+    upload sends the bytes; after remember() has seen Telegram's reply,
+    input_file() returns the uploaded file_id so later targets don't
+    upload the file again.
+    """
+
+    def __init__(self, kind, file, size):
+        self.kind = kind  # "photo" or "video", also the Bot API argument name
+        self.file = file
+        self.size = size
+        self.file_id = None
+
+    @property
+    def filename(self):
+        return "photo.jpg" if self.kind == "photo" else "video.mp4"
+
+    @property
+    def send_method(self):
+        return f"send_{self.kind}"
+
+    def input_file(self):
+        if self.file_id:
+            return self.file_id
+        # PTB needs a filename, which an anonymous spooled file doesn't have
+        self.file.seek(0)
+        return InputFile(self.file.read(), filename=self.filename)
+
+    def input_media(self, caption=None):
+        # One item of a send_media_group call
+        media_class = InputMediaPhoto if self.kind == "photo" else InputMediaVideo
+        return media_class(self.input_file(), caption=caption, parse_mode="HTML" if caption else None)
+
+    def remember(self, sent_message):
+        # Keep the file_id of the uploaded copy for the next target
+        if self.file_id or sent_message is None:
+            return
+        if self.kind == "photo" and sent_message.photo:
+            self.file_id = sent_message.photo[-1].file_id
+        elif self.kind == "video" and sent_message.video:
+            self.file_id = sent_message.video.file_id
+
+    def close(self):
+        self.file.close()
+
+class MediaRelay:
+    """
+    Streams source media from Telethon straight into a SpooledTemporaryFile,
+    so nothing touches the disk unless a file is larger than
+    `spool_max_bytes`, and nothing has to be cleaned up afterwards.
+    """
+
+    def __init__(self, client, spool_max_bytes=20 * 1024 * 1024):
+        self.client = client
+        self.spool_max_bytes = spool_max_bytes
+
+    async def fetch(self, message):
+        """
+        Download the photo or video of `message`. Returns a RelayedMedia, or
+        None if the message has neither or the download failed.
+        """
+        if message.photo:
+            kind = "photo"
+        elif message.video:
+            kind = "video"
+        else:
+            return None
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes)
+        try:
+            # Telethon writes the chunks to the file object as they arrive
+            await self.client.download_media(message, file=spool)
+        except Exception as e:
+            log.error(f"Error downloading {kind}: {e}")
+            spool.close()
+            return None
+        return RelayedMedia(kind, spool, spool.tell())
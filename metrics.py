@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Plain logger: structured_log counts dropped records here, so it can't be imported back
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a few milliseconds (a cleaner pass) to minutes (publish lag during catch-up)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket the quantile falls in, as Prometheus would estimate it
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Metrics:
+    """
+    In-process counters, gauges and latency histograms, labelled
+    Prometheus-style.
+    Exported as Prometheus text by serve() and as JSON by run_json_dump().
+    All metric names get the `prefix`.
+    """
+
+    def __init__(self, prefix="bot_"):
+        self.prefix = prefix
+        self._counters = {}  # (name, label key) -> value
+        self._gauges = {}  # (name, label key) -> value
+        self._histograms = {}  # (name, label key) -> Histogram
+        # Sends and translations also report from worker threads
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        # Times the block into the `name` histogram, whether or not it raises
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            typed = set()
+            for (name, label_key), value in counters:
+                full_name = self.prefix + name
+                if full_name not in typed:
+                    lines.append(f"# TYPE {full_name} counter")
+                    typed.add(full_name)
+                lines.append(f"{full_name}{_format_labels(label_key)} {value}")
+            for (name, label_key), value in gauges:
+                full_name = self.prefix + name
+                if full_name not in typed:
+                    lines.append(f"# TYPE {full_name} gauge")
+                    typed.add(full_name)
+                lines.append(f"{full_name}{_format_labels(label_key)} {value}")
+            for (name, label_key), histogram in histograms:
+                full_name = self.prefix + name
+                if full_name not in typed:
+                    lines.append(f"# TYPE {full_name} histogram")
+                    typed.add(full_name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{_format_labels(label_key, [('le', bound)])} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(label_key)} {histogram.sum}")
+                lines.append(f"{full_name}_count{_format_labels(label_key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        counters = {}
+        gauges = {}
+        histograms = {}
+        with self._lock:
+            for (name, label_key), value in self._counters.items():
+                counters.setdefault(name, {})[_format_labels(label_key) or "total"] = value
+            for (name, label_key), value in self._gauges.items():
+                gauges.setdefault(name, {})[_format_labels(label_key) or "value"] = value
+            for (name, label_key), histogram in self._histograms.items():
+                histograms.setdefault(name, {})[_format_labels(label_key) or "all"] = {
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+        return {
+            "uptime_seconds": time.time() - self.started_at,
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+        }
+
+    async def serve(self, host="127.0.0.1", port=9464):
+        """
+        Serve GET /metrics in the Prometheus text format until cancelled.
+        """
+        async def handle(reader, writer):
+            try:
+                request_line = await reader.readline()
+                # Skip the headers, nothing in them matters here
+                while (await reader.readline()).strip():
+                    pass
+                parts = request_line.decode("latin-1").split()
+                if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                    status, body = "200 OK", self.render_prometheus().encode()
+                else:
+                    status, body = "404 Not Found", b"Not found\n"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        log.info(f"Serving metrics on http://{host}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+    async def run_json_dump(self, path, interval_seconds):
+        # Written to a temp file and renamed, so readers never see half a file
+        while True:
+            await asyncio.sleep(interval_seconds)
+            temp_path = path + ".tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, path)
+            except OSError as e:
+                log.error(f"Error writing metrics to {path}: {e}")
+
+# Shared by the bot's modules
+metrics = Metrics()
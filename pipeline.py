@@ -0,0 +1,120 @@
+import asyncio
+import itertools
+import time
+from metrics import metrics
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+PRIORITY_ALERT = 0
+PRIORITY_NEWS = 1
+
+class Job:
+    """
+    One source message moving through the pipeline. Stages attach whatever
+    they produce as attributes; `stage_times` records how long each stage
+    took, in seconds.
+    """
+
+    def __init__(self, message, priority=PRIORITY_NEWS, **fields):
+        self.message = message
+        self.priority = priority
+        self.created_at = time.monotonic()
+        self.stage_times = {}
+        self.__dict__.update(fields)
+
+class Pipeline:
+    """
+    A chain of named stages connected by bounded priority queues.
+
+    Each stage has its own pool of worker tasks. A stage handler is a
+    coroutine taking a Job and returning the name of the next stage, a list
+    of names to fan the job out to several stages, or None when the job is
+    finished. Lower priority numbers are served first, so alerts overtake
+    queued news at every stage. put() waits while the target queue is
+    full, which pushes back on the stages (and the source) upstream.
+
+    A handler that raises finishes the job. The error is logged, and
+    `on_error(job, stage_name)`, if set, is called so the job can release
+    what it holds.
+    """
+
+    def __init__(self, queue_size=100, on_error=None):
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.stages = {}
+        self._queues = {}
+        self._workers = []
+        self._sequence = itertools.count()
+        # Jobs queued or being handled anywhere in the pipeline
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def add_stage(self, name, handler, workers=1):
+        self.stages[name] = (handler, workers)
+        self._queues[name] = asyncio.PriorityQueue(maxsize=self.queue_size)
+
+    async def put(self, stage_name, job):
+        self._pending += 1
+        self._idle.clear()
+        # The sequence number keeps FIFO order within a priority level
+        await self._queues[stage_name].put((job.priority, next(self._sequence), job))
+
+    def start(self):
+        for name, (handler, workers) in self.stages.items():
+            for i in range(workers):
+                self._workers.append(asyncio.create_task(self._work(name, handler), name=f"{name}-{i}"))
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self, name, handler):
+        queue = self._queues[name]
+        while True:
+            _, _, job = await queue.get()
+            start = time.monotonic()
+            try:
+                next_stages = await handler(job)
+            except Exception as e:
+                log.error(
+                    f"Error in pipeline stage {name} for message {getattr(job.message, 'id', '?')}: {e}",
+                    stage=name, channel_id=getattr(job, "channel_id", None), message_id=getattr(job.message, "id", None)
+                )
+                metrics.inc("stage_errors_total", stage=name)
+                next_stages = None
+                if self.on_error:
+                    try:
+                        self.on_error(job, name)
+                    except Exception as e:
+                        log.error(f"Error cleaning up after pipeline stage {name}: {e}", stage=name)
+            finally:
+                elapsed = time.monotonic() - start
+                job.stage_times[name] = job.stage_times.get(name, 0.0) + elapsed
+                metrics.observe("stage_seconds", elapsed, stage=name)
+            if isinstance(next_stages, str):
+                next_stages = [next_stages]
+            for next_stage in next_stages or ():
+                await self.put(next_stage, job)
+            self._pending -= 1
+            if not self._pending:
+                self._idle.set()
+
+    def queue_depths(self):
+        return {name: queue.qsize() for name, queue in self._queues.items()}
+
+    async def join(self):
+        # Wait until every job has finished its last stage
+        await self._idle.wait()
+
+    async def report_depths(self, interval_seconds):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            depths = self.queue_depths()
+            for name, depth in depths.items():
+                metrics.set("queue_depth", depth, stage=name)
+            if any(depths.values()):
+                log.info("Pipeline queue depths: " + ", ".join(f"{name}={depth}" for name, depth in depths.items()), depths=depths)
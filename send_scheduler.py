@@ -0,0 +1,144 @@
+import asyncio
+import random
+import time
+from datetime import timedelta
+from metrics import metrics
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+class TokenBucket:
+    """
+    Lets through `rate` calls per second on average, with bursts of up to
+    `capacity`. acquire() waits for a token; callers are served in order.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds):
+        # Telegram told us to back off; nobody gets a token until then
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def _retry_after_seconds(error):
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class SendScheduler:
+    """
+    Owns every outbound Bot API call.
+
+    Sends to one chat are paced by a token bucket per chat, and all sends
+    share a global bucket, both sized to Telegram's published limits. A
+    RetryAfter (flood wait) pauses that chat for the time Telegram asks and
+    the send is retried; timeouts and network errors are retried with
+    exponential backoff and jitter. Errors that won't go away on a retry
+    (bad request, bot removed from the chat) are raised immediately.
+    """
+
+    def __init__(self, bot, chat_rate_per_minute=20, chat_burst=10, global_rate_per_second=30,
+                 max_retries=5, retry_base_seconds=1.0, retry_max_seconds=30.0):
+        self.bot = bot
+        self.chat_rate = chat_rate_per_minute / 60
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._global_bucket = TokenBucket(global_rate_per_second, global_rate_per_second)
+        self._chat_buckets = {}
+        self.sent = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.failed = 0
+
+    def _bucket_for(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _backoff(self, attempt):
+        # Full jitter, so retries from concurrent sends don't line up
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+
+    async def send(self, method, chat_id, **kwargs):
+        """
+        Call `bot.<method>(chat_id=chat_id, **kwargs)` once the rate limits
+        allow it, retrying flood waits and transient errors. Media can be
+        bytes, a file_id or a seekable file, which is rewound before every
+        attempt. Returns whatever the Bot method returns.
+        """
+        bucket = self._bucket_for(chat_id)
+        call = getattr(self.bot, method)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            await self._global_bucket.acquire()
+            for value in kwargs.values():
+                if hasattr(value, "seek"):
+                    value.seek(0)
+            try:
+                with metrics.span("send_seconds", method=method):
+                    result = await call(chat_id=chat_id, **kwargs)
+                self.sent += 1
+                metrics.inc("sends_total", method=method, outcome="sent")
+                return result
+            except RetryAfter as e:
+                wait = _retry_after_seconds(e)
+                self.flood_waits += 1
+                metrics.inc("sends_total", method=method, outcome="flood_wait")
+                log.warning(f"Flood wait of {wait:.0f}s on chat {chat_id} for {method}", chat_id=chat_id, method=method, wait_seconds=wait)
+                bucket.pause(wait)
+            except (BadRequest, Forbidden):
+                self.failed += 1
+                metrics.inc("sends_total", method=method, outcome="failed")
+                raise
+            except (TimedOut, NetworkError) as e:
+                # TimedOut may mean the post went through, so a retry can rarely duplicate it
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    metrics.inc("sends_total", method=method, outcome="failed")
+                    raise
+                metrics.inc("sends_total", method=method, outcome="retry")
+                delay = self._backoff(attempt)
+                log.warning(f"{method} to chat {chat_id} failed ({e}), retrying in {delay:.1f}s", chat_id=chat_id, method=method)
+                await asyncio.sleep(delay)
+            if attempt >= self.max_retries:
+                self.failed += 1
+                metrics.inc("sends_total", method=method, outcome="failed")
+                raise RuntimeError(f"{method} to chat {chat_id} still rate limited after {attempt + 1} attempts")
+            attempt += 1
+            self.retries += 1
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "retries": self.retries,
+            "flood_waits": self.flood_waits,
+            "failed": self.failed,
+        }
@@ -0,0 +1,178 @@
+import asyncio
+import queue
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from telethon import TelegramClient, events, utils
+from telethon.tl.types import PeerChannel
+import config
+from media_relay import MediaRelay, RelayedMedia
+from message_cleaner import parse_message
+from metrics import metrics
+from structured_log import get_logger, setup_logging_from_config
+
+log = get_logger(__name__)
+
+# Sharded mode: source channels are split across shard processes, each with
+# its own Telethon session. A shard receives and catches up on its channels,
+# parses every message and downloads its media, then hands the result to the
+# publisher process over a multiprocessing queue. The publisher (main_bot)
+# owns everything that has to see all channels at once: dedup, alert
+# coalescing, translation, watermarks and the outbound send limits.
+
+@dataclass
+class ShardChannel:
+    """Title of a source channel, resolved by the shard that follows it."""
+    id: int
+    title: str
+    username: str = None
+
+@dataclass
+class ShardMessage:
+    """
+    A source message as a shard hands it to the publisher. Picklable, and
+    shaped like the parts of a Telethon Message the pipeline reads.
+    """
+    id: int
+    channel_id: int
+    text: str
+    timestamp: float
+    parsed: object
+    grouped_id: int = None
+    media_kind: str = None  # "photo", "video" or None
+    media_bytes: bytes = None
+    catching_up: bool = False
+
+    @property
+    def peer_id(self):
+        return PeerChannel(self.channel_id)
+
+    @property
+    def date(self):
+        return datetime.fromtimestamp(self.timestamp, timezone.utc)
+
+    @property
+    def photo(self):
+        return self.media_kind == "photo"
+
+    @property
+    def video(self):
+        return self.media_kind == "video"
+
+class ShardMediaRelay(MediaRelay):
+    """
+    Media relay for the publisher in sharded mode. The shard has already
+    downloaded the media, so fetch() only spools the bytes it sent.
+    """
+
+    def __init__(self, spool_max_bytes=20 * 1024 * 1024):
+        super().__init__(None, spool_max_bytes)
+
+    async def fetch(self, message):
+        if not message.media_bytes:
+            return None
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes)
+        spool.write(message.media_bytes)
+        return RelayedMedia(message.media_kind, spool, len(message.media_bytes))
+
+def partition_channels(channels, shard_count):
+    # Round-robin, so every shard gets a similar number of channels
+    shards = [[] for _ in range(shard_count)]
+    for i, channel in enumerate(channels):
+        shards[i % shard_count].append(channel)
+    return [shard for shard in shards if shard]
+
+def shard_session_name(index):
+    return f"session_name_shard{index}"
+
+def create_shard_client(index):
+    return TelegramClient(shard_session_name(index), config.TELETHON_API_ID, config.TELETHON_API_HASH)
+
+async def to_shard_message(message, catching_up=False):
+    channel_id = message.peer_id.channel_id
+    text = message.text or ""
+    parsed = parse_message(text, channel_id)
+    media_kind = "photo" if message.photo else "video" if message.video else None
+    media_bytes = None
+    # Album parts without a caption look ad-only on their own, but their media is still needed
+    if media_kind and (message.grouped_id or parsed.kind != "ad-only"):
+        try:
+            media_bytes = await message.download_media(file=bytes)
+        except Exception as e:
+            log.error(f"Error downloading {media_kind}: {e}")
+            media_kind = None
+    return ShardMessage(
+        id=message.id,
+        channel_id=channel_id,
+        text=text,
+        timestamp=message.date.timestamp(),
+        parsed=parsed,
+        grouped_id=message.grouped_id,
+        media_kind=media_kind,
+        media_bytes=media_bytes,
+        catching_up=catching_up,
+    )
+
+async def run_shard_async(index, channels, shard_queue, watermarks, client_factory=create_shard_client):
+    client = client_factory(index)
+    caught_up = asyncio.Event()
+
+    async def hand_over(message, catching_up=False):
+        shard_message = await to_shard_message(message, catching_up)
+        # Blocks while the publisher is behind, which pushes back on this shard
+        await asyncio.to_thread(shard_queue.put, shard_message)
+
+    @client.on(events.NewMessage(chats=channels))
+    async def handle_new_message(event):
+        # Live messages wait for the backlog, so posts stay in order
+        await caught_up.wait()
+        await hand_over(event.message)
+
+    await client.start()
+    log.info(f"Shard {index} connected, following {len(channels)} channels")
+    try:
+        for entity in await client.get_entity(channels):
+            channel = ShardChannel(entity.id, getattr(entity, 'title', None), getattr(entity, 'username', None))
+            await asyncio.to_thread(shard_queue.put, channel)
+    except Exception as e:
+        log.error(f"Shard {index} could not resolve its channels: {e}")
+    try:
+        for channel in channels:
+            watermark = watermarks.get(utils.resolve_id(channel)[0])
+            if watermark is None:
+                continue
+            queued = 0
+            try:
+                async for message in client.iter_messages(channel, min_id=watermark, reverse=True, wait_time=0):
+                    await hand_over(message, catching_up=True)
+                    queued += 1
+            except Exception as e:
+                # As in single-process mode: the rest of this backlog is skipped, live mode still starts
+                log.error(f"Catch-up of {channel} stopped after {queued} messages: {e}",
+                          channel_id=utils.resolve_id(channel)[0])
+                metrics.inc("catchup_errors_total")
+    finally:
+        caught_up.set()
+    await client.run_until_disconnected()
+
+def run_shard(index, channels, shard_queue, watermarks, client_factory=create_shard_client):
+    """
+    Entry point of a shard process. `client_factory(index)` builds its
+    Telegram client; tests can pass one returning a local stand-in.
+    """
+    # A spawned process starts without the publisher's logging set up
+    setup_logging_from_config()
+    try:
+        asyncio.run(run_shard_async(index, channels, shard_queue, watermarks, client_factory))
+    except KeyboardInterrupt:
+        pass
+
+async def receive_from_shards(shard_queue, poll_seconds=1.0):
+    """
+    Yield what the shards send, without blocking the publisher's event loop.
+    """
+    while True:
+        try:
+            yield await asyncio.to_thread(shard_queue.get, True, poll_seconds)
+        except queue.Empty:
+            continue
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import config
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+class StateStore:
+    """
+    Crash-safe persistence for the bot, backed by one SQLite database in WAL mode.
+
+    Holds the per-channel watermarks (last processed message id), the
+    deduplication window and the on-disk tier of the translation cache.
+    Writes are buffered in memory and coalesced (only the latest watermark
+    per channel is kept), then committed together in one transaction by
+    flush(), which run_flusher() calls from a worker thread so the event
+    loop never waits on the disk. A crash loses at most the last flush
+    interval; it can't leave a half-written file behind.
+    """
+
+    def __init__(self, path="bot_state.db"):
+        self.path = path
+        # Separate connections so lookups don't wait behind a flush in progress
+        self._writer = self._connect()
+        self._reader = self._connect()
+        self._writer_lock = threading.Lock()
+        self._reader_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_watermarks = {}
+        self._pending_translations = {}
+        self._pending_dedup_window = None
+        self._create_tables()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL still never corrupts the database; it only risks the last commit on power loss
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _create_tables(self):
+        with self._writer_lock, self._writer:
+            self._writer.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks (channel_id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL)"
+            )
+            self._writer.execute(
+                "CREATE TABLE IF NOT EXISTS dedup_window (timestamp REAL NOT NULL, text TEXT NOT NULL)"
+            )
+            self._writer.execute(
+                "CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    # --- Watermarks ---
+
+    def load_watermarks(self):
+        with self._reader_lock:
+            rows = self._reader.execute("SELECT channel_id, message_id FROM watermarks").fetchall()
+        watermarks = {channel_id: message_id for channel_id, message_id in rows}
+        with self._pending_lock:
+            watermarks.update(self._pending_watermarks)
+        return watermarks
+
+    def set_watermark(self, channel_id, message_id):
+        with self._pending_lock:
+            if message_id > self._pending_watermarks.get(channel_id, -1):
+                self._pending_watermarks[channel_id] = message_id
+
+    def import_json_watermarks(self, json_path):
+        """
+        One-off migration from the old last_message_ids.json file.
+        Only runs when the store has no watermarks yet.
+        """
+        if not os.path.exists(json_path) or self.load_watermarks():
+            return False
+        try:
+            with open(json_path, 'r') as f:
+                old_ids = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.error(f"Could not import {json_path}: {e}")
+            return False
+        for channel_id, message_id in old_ids.items():
+            self.set_watermark(int(channel_id), message_id)
+        self.flush()
+        log.info(f"Imported {len(old_ids)} watermarks from {json_path}")
+        return True
+
+    # --- Translation cache ---
+
+    def get_translation(self, key):
+        with self._pending_lock:
+            if key in self._pending_translations:
+                return self._pending_translations[key]
+        with self._reader_lock:
+            row = self._reader.execute("SELECT value FROM translations WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put_translation(self, key, value):
+        with self._pending_lock:
+            self._pending_translations[key] = value
+
+    # --- Dedup window ---
+
+    def load_dedup_window(self):
+        with self._reader_lock:
+            return self._reader.execute(
+                "SELECT timestamp, text FROM dedup_window ORDER BY timestamp"
+            ).fetchall()
+
+    def save_dedup_window(self, entries):
+        # Replaces the stored window on the next flush; only the latest snapshot is written
+        with self._pending_lock:
+            self._pending_dedup_window = list(entries)
+
+    # --- Flushing ---
+
+    def flush(self):
+        with self._pending_lock:
+            watermarks = self._pending_watermarks
+            translations = self._pending_translations
+            dedup_window = self._pending_dedup_window
+            self._pending_watermarks = {}
+            self._pending_translations = {}
+            self._pending_dedup_window = None
+        if not watermarks and not translations and dedup_window is None:
+            return
+        try:
+            with self._writer_lock, self._writer:
+                if watermarks:
+                    self._writer.executemany(
+                        "INSERT INTO watermarks (channel_id, message_id) VALUES (?, ?) "
+                        "ON CONFLICT(channel_id) DO UPDATE SET message_id = MAX(message_id, excluded.message_id)",
+                        watermarks.items()
+                    )
+                if translations:
+                    self._writer.executemany(
+                        "INSERT OR REPLACE INTO translations (key, value) VALUES (?, ?)",
+                        translations.items()
+                    )
+                if dedup_window is not None:
+                    self._writer.execute("DELETE FROM dedup_window")
+                    self._writer.executemany(
+                        "INSERT INTO dedup_window (timestamp, text) VALUES (?, ?)", dedup_window
+                    )
+        except sqlite3.Error:
+            # Put the writes back so the next flush retries them
+            with self._pending_lock:
+                for channel_id, message_id in watermarks.items():
+                    if message_id > self._pending_watermarks.get(channel_id, -1):
+                        self._pending_watermarks[channel_id] = message_id
+                for key, value in translations.items():
+                    self._pending_translations.setdefault(key, value)
+                if self._pending_dedup_window is None:
+                    self._pending_dedup_window = dedup_window
+            raise
+
+    async def run_flusher(self, interval_seconds):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.flush)
+            except sqlite3.Error as e:
+                log.error(f"Error saving bot state: {e}")
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        self._reader.close()
+
+# Shared by the bot and the translation cache
+store = StateStore(config.STATE_DB_FILE)
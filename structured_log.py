@@ -0,0 +1,175 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from metrics import metrics
+
+# Logging for the bot. Records carry structured fields (channel_id,
+# message_id, kind, decision, ...) and are written by a background thread,
+# so a slow stdout or log file never stalls the event loop. Debug records
+# are rate-limited per source channel, so a busy channel or an alert storm
+# can't flood the log; decisions are logged at INFO and always kept.
+
+_RESERVED_KWARGS = {"exc_info", "stack_info", "stacklevel", "extra"}
+
+class EventLogger(logging.LoggerAdapter):
+    """
+    log.info("Skipping duplicate", channel_id=..., decision="duplicate"):
+    keyword arguments become the record's structured fields.
+    """
+
+    def process(self, msg, kwargs):
+        fields = {name: kwargs.pop(name) for name in list(kwargs) if name not in _RESERVED_KWARGS}
+        kwargs["extra"] = {"fields": fields}
+        return msg, kwargs
+
+def get_logger(name):
+    return EventLogger(logging.getLogger(name), {})
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for journald, docker and log shippers."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # Shard processes write to the same log
+        if record.processName != "MainProcess":
+            entry["process"] = record.processName
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """The message followed by its fields as key=value, for reading in a terminal."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{name}={value!r}" for name, value in fields.items())
+        return text
+
+class DebugRateLimiter(logging.Filter):
+    """
+    Lets through at most `burst` debug records per source at once, refilled
+    at `rate_per_second`. The source is the record's channel_id, or its
+    logger for records without one. The next record let through reports
+    how many were dropped in between. Records at INFO and above always pass.
+    """
+
+    def __init__(self, rate_per_second=5, burst=20):
+        super().__init__()
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._buckets = {}  # source -> [tokens, last refill, dropped]
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        fields = getattr(record, "fields", {})
+        source = fields.get("channel_id", record.name)
+        now = time.monotonic()
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            bucket = self._buckets[source] = [self.burst, now, 0]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_second)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1
+        if bucket[2]:
+            record.fields = dict(fields, dropped_debug=bucket[2])
+            bucket[2] = 0
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The stock prepare() formats here, on the caller's thread, and drops
+        # exc_info; formatting is left to the writer, which puts the traceback in `exc`
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    # A full queue drops the record instead of blocking the caller
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_records_dropped_total")
+
+class BackgroundWriter(logging.handlers.QueueListener):
+    """Writes queued records from its own thread; stop() flushes what is left."""
+
+    def enqueue_sentinel(self):
+        # Waits for room rather than failing when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        # Runs at exit too, so stopping twice is fine
+        if self._thread is not None:
+            super().stop()
+
+_writer = None
+
+def setup_logging(level="INFO", json_format=True, log_file=None, stream=sys.stdout,
+                  queue_size=10000, debug_rate_per_second=5, debug_burst=20):
+    """
+    Route all logging through a bounded queue to a background writer
+    thread, which writes to `stream` and/or `log_file`. Returns the
+    BackgroundWriter; it is stopped, flushing what is queued, at exit.
+    """
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+    formatter = JsonFormatter() if json_format else TextFormatter()
+    handlers = []
+    if stream is not None:
+        handlers.append(logging.StreamHandler(stream))
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(DebugRateLimiter(debug_rate_per_second, debug_burst))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Third-party libraries stay at INFO and above even when the bot logs debug
+    for name in ("telethon", "telegram", "httpx", "httpcore"):
+        logging.getLogger(name).setLevel(max(root.level, logging.INFO))
+
+    _writer = BackgroundWriter(log_queue, *handlers, respect_handler_level=True)
+    _writer.start()
+    atexit.register(_writer.stop)
+    return _writer
+
+def setup_logging_from_config():
+    # Imported here: config needs the Telegram credentials, and every module imports this one
+    import config
+    return setup_logging(
+        level=config.LOG_LEVEL,
+        json_format=config.LOG_JSON,
+        log_file=config.LOG_FILE,
+        queue_size=config.LOG_QUEUE_SIZE,
+        debug_rate_per_second=config.LOG_DEBUG_RATE_PER_SECOND,
+        debug_burst=config.LOG_DEBUG_BURST
+    )
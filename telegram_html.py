@@ -0,0 +1,73 @@
+import re
+from functools import lru_cache
+from html import escape
+
+# Rendered captions are kept for this many distinct texts; the same text is
+# rendered for every target post and again for each alert edit
+CACHE_SIZE = 1024
+
+# Everything that isn't plain text: a link, or an emphasis marker
+_TOKEN = re.compile(
+    r"\[(?P<link_text>[^\[\]\n]+)\]\((?P<url>https?://[^\s()]+)\)"
+    r"|(?P<marker>\*\*\*|\*\*|\*|__|_)"
+)
+
+_TAGS = {
+    "***": ("<b><i>", "</i></b>"),
+    "**": ("<b>", "</b>"),
+    "__": ("<b>", "</b>"),
+    "*": ("<i>", "</i>"),
+    "_": ("<i>", "</i>"),
+}
+
+# Inside a word these are literal (snake_case, t.me/red_alert_24x6, 24*6)
+_INTRAWORD_LITERAL = {"*", "_", "__"}
+
+def _render_line(line):
+    out = []
+    open_markers = []  # (marker, index in `out` of the marker's text)
+    pos = 0
+    for match in _TOKEN.finditer(line):
+        out.append(escape(line[pos:match.start()], quote=False))
+        pos = match.end()
+        if match.group("url"):
+            link_text = _render_line(match.group("link_text"))
+            out.append(f'<a href="{escape(match.group("url"))}">{link_text}</a>')
+            continue
+        marker = match.group("marker")
+        before = line[match.start() - 1] if match.start() else ""
+        after = line[pos] if pos < len(line) else ""
+        if marker in _INTRAWORD_LITERAL and before.isalnum() and after.isalnum():
+            out.append(marker)
+        elif (open_markers and open_markers[-1][0] == marker and before and not before.isspace()
+                and any(out[open_markers[-1][1] + 1:])):
+            _, index = open_markers.pop()
+            out[index] = _TAGS[marker][0]
+            out.append(_TAGS[marker][1])
+        elif after and not after.isspace():
+            # Stays literal unless a matching marker closes it
+            open_markers.append((marker, len(out)))
+            out.append(marker)
+        else:
+            out.append(marker)
+    out.append(escape(line[pos:], quote=False))
+    return "".join(out)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def markdown_to_telegram_html(text):
+    """
+    Render the Markdown of a Telegram post (**bold**, __bold__, *italic*,
+    _italic_, ***both*** and [text](url) links) as Telegram HTML in one
+    pass. Everything else is escaped, and markers without a partner are
+    kept as text, so the result is always well-formed. Emphasis doesn't
+    span lines.
+    """
+    return "\n".join(_render_line(line) for line in text.split("\n"))
+
+def caption_html(header, text, channel_name):
+    """
+    A post's caption: the bold header, the rendered text and, in italics,
+    the source channel. The channel title is plain text, so it's escaped.
+    """
+    text_html = markdown_to_telegram_html(text) if text else ""
+    return f"<b>{escape(header, quote=False)}</b>\n{text_html}\n\n(<i>{escape(channel_name, quote=False)}</i>)"
@@ -0,0 +1,145 @@
+import os
+import json
+import random
+import time
+from dotenv import load_dotenv
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+load_dotenv()
+
+class TranslationBackend:
+    """
+    A translation service. `translate_batch` is a blocking call that returns
+    one translation per input text, in the same order; callers run it in a
+    worker thread.
+    """
+    name = "base"
+
+    def translate_batch(self, texts, from_lang="he", to_lang="en"):
+        raise NotImplementedError
+
+    def translate(self, text, from_lang="he", to_lang="en"):
+        return self.translate_batch([text], from_lang, to_lang)[0]
+
+def _parse_batch_response(response_text, expected_count):
+    # Gemini sometimes wraps JSON in a ```json fence
+    response_text = response_text.strip()
+    if response_text.startswith("```"):
+        response_text = response_text.strip("`")
+        if response_text.startswith("json"):
+            response_text = response_text[4:]
+    try:
+        translations = json.loads(response_text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(translations, list) or len(translations) != expected_count:
+        return None
+    if not all(isinstance(t, str) for t in translations):
+        return None
+    return [t.strip() for t in translations]
+
+# Names for the prompts of backends that take the languages in plain words
+LANGUAGE_NAMES = {
+    "ar": "Arabic", "de": "German", "en": "English", "es": "Spanish", "fr": "French",
+    "he": "Hebrew", "it": "Italian", "pt": "Portuguese", "ru": "Russian", "uk": "Ukrainian",
+}
+
+def language_name(code):
+    return LANGUAGE_NAMES.get(code, code)
+
+class GeminiBackend(TranslationBackend):
+    name = "gemini"
+    MODEL_NAME = "gemini-2.0-flash"
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        # Building a GenerativeModel is not free, so one instance is shared by all calls
+        self.model = genai.GenerativeModel(self.MODEL_NAME)
+
+    def _translate_one(self, text, from_lang, to_lang):
+        prompt = (
+            f"Translate the following text from {language_name(from_lang)} to {language_name(to_lang)}. "
+            f"Only output the translation, no explanation.\n\nText: {text}"
+        )
+        response = self.model.generate_content(prompt)
+        # The response.text contains the translation
+        return response.text.strip()
+
+    def translate_batch(self, texts, from_lang="he", to_lang="en"):
+        # Several texts go out as a single request; if the reply can't be
+        # split back up, each text is translated on its own
+        if len(texts) == 1:
+            return [self._translate_one(texts[0], from_lang, to_lang)]
+        prompt = (
+            f"Translate each string in the following JSON array from {language_name(from_lang)} "
+            f"to {language_name(to_lang)}. "
+            "Reply with only a JSON array of the translated strings, in the same order "
+            "and with the same number of items, no explanation.\n\n"
+            + json.dumps(texts, ensure_ascii=False)
+        )
+        response = self.model.generate_content(prompt)
+        translations = _parse_batch_response(response.text, len(texts))
+        if translations is None:
+            log.warning(f"Could not parse batched translation of {len(texts)} texts, translating one by one")
+            translations = [self._translate_one(text, from_lang, to_lang) for text in texts]
+        return translations
+
+class DeepLBackend(TranslationBackend):
+    name = "deepl"
+
+    # DeepL wants a regional variant for some target languages
+    TARGET_LANG_CODES = {"en": "EN-US", "pt": "PT-BR"}
+
+    def __init__(self, api_key):
+        import deepl
+        self.translator = deepl.Translator(api_key)
+
+    def translate_batch(self, texts, from_lang="he", to_lang="en"):
+        results = self.translator.translate_text(
+            texts,
+            source_lang=from_lang.upper(),
+            target_lang=self.TARGET_LANG_CODES.get(to_lang, to_lang.upper())
+        )
+        return [result.text for result in results]
+
+class StubBackend(TranslationBackend):
+    """
+    Local stand-in that never touches the network. `latency` is a number of
+    seconds or a function returning one, and `fail_rate` is the chance that
+    a call raises, so slow and flaky services can be simulated.
+    """
+    name = "stub"
+
+    def __init__(self, latency=0.0, fail_rate=0.0, name=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        if name:
+            self.name = name
+        self.calls = 0
+
+    def translate_batch(self, texts, from_lang="he", to_lang="en"):
+        self.calls += 1
+        delay = self.latency() if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise RuntimeError(f"{self.name} backend failed (simulated)")
+        return [f"[{to_lang}] {text}" for text in texts]
+
+def create_backend(name):
+    """
+    Build a backend by name, reading its API key from the environment.
+    Returns None if the key is missing.
+    """
+    if name == "gemini":
+        api_key = os.getenv("GEMINI_API_KEY")
+        return GeminiBackend(api_key) if api_key else None
+    if name == "deepl":
+        api_key = os.getenv("DEEPL_API_KEY")
+        return DeepLBackend(api_key) if api_key else None
+    if name == "stub":
+        return StubBackend()
+    raise ValueError(f"Unknown translation backend: {name}")
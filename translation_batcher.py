@@ -0,0 +1,76 @@
+import asyncio
+
+class TranslationBatcher:
+    """
+    Collects translation requests and sends them to `translate_batch` in groups.
+
+    While fewer than `max_in_flight` batches are running a request is sent
+    immediately, so a quiet channel pays no extra latency. Once every slot is
+    busy, new requests wait until `window_seconds` pass, `max_items` requests
+    or `max_chars` characters pile up, or a running batch finishes, and are
+    then sent together in one call.
+
+    `translate_batch(texts, from_lang, to_lang)` is a coroutine that returns
+    one translation per input text, in the same order.
+    """
+
+    def __init__(self, translate_batch, window_seconds=0.05, max_items=10, max_chars=6000, max_in_flight=4):
+        self.translate_batch = translate_batch
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self.max_in_flight = max_in_flight
+        # Requests are only batched with others for the same language pair
+        self._pending = {}  # (from_lang, to_lang) -> list of (text, future)
+        self._pending_chars = {}
+        self._timers = {}
+        self._in_flight = 0
+        self.batches_sent = 0
+        self.texts_sent = 0
+
+    async def translate(self, text, from_lang="he", to_lang="en"):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pair = (from_lang, to_lang)
+        self._pending.setdefault(pair, []).append((text, future))
+        self._pending_chars[pair] = self._pending_chars.get(pair, 0) + len(text)
+        if self._in_flight < self.max_in_flight:
+            self._flush(pair)
+        elif len(self._pending[pair]) >= self.max_items or self._pending_chars[pair] >= self.max_chars:
+            self._flush(pair)
+        elif pair not in self._timers:
+            self._timers[pair] = loop.call_later(self.window_seconds, self._flush, pair)
+        # Shielded so a caller that times out does not cancel the whole batch
+        return await asyncio.shield(future)
+
+    def _flush(self, pair):
+        timer = self._timers.pop(pair, None)
+        if timer:
+            timer.cancel()
+        items = self._pending.pop(pair, [])
+        self._pending_chars.pop(pair, None)
+        if not items:
+            return
+        self._in_flight += 1
+        asyncio.get_running_loop().create_task(self._run(pair, items))
+
+    async def _run(self, pair, items):
+        from_lang, to_lang = pair
+        texts = [text for text, _ in items]
+        try:
+            results = await self.translate_batch(texts, from_lang, to_lang)
+            self.batches_sent += 1
+            self.texts_sent += len(texts)
+            for (_, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+            # A slot just freed up, so send whatever queued behind this batch
+            for waiting_pair in list(self._pending):
+                if self._in_flight < self.max_in_flight:
+                    self._flush(waiting_pair)
@@ -0,0 +1,72 @@
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+def normalize_for_cache(text):
+    # NFC + collapsed whitespace, so cosmetic differences still hit the cache
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+def cache_key(text, from_lang, to_lang):
+    normalized = normalize_for_cache(text)
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return f"{from_lang}:{to_lang}:{digest}"
+
+class TranslationCache:
+    """
+    Two-tier translation cache: an in-memory LRU in front of the translations
+    table of the bot's StateStore, which survives restarts. Entries are keyed
+    on the normalized text and the language pair.
+    """
+
+    def __init__(self, store, max_memory_entries=2000):
+        self.store = store
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        # Calls come from the event loop and from translation worker threads
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, text, from_lang="he", to_lang="en"):
+        key = cache_key(text, from_lang, to_lang)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        value = self.store.get_translation(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, text, translation, from_lang="he", to_lang="en"):
+        if not translation:
+            return
+        key = cache_key(text, from_lang, to_lang)
+        with self._lock:
+            self._remember(key, translation)
+        self.store.put_translation(key, translation)
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hit_rate = (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hit_rate,
+            "memory_entries": len(self._memory),
+        }
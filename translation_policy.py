@@ -0,0 +1,195 @@
+import asyncio
+import time
+from collections import deque
+from structured_log import get_logger
+
+log = get_logger(__name__)
+
+class TranslationUnavailable(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a backend after `failure_threshold` failures in
+    a row. After `cooldown_seconds` a single trial request is let through;
+    if it succeeds the breaker closes again.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown_seconds=60):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._trial_in_flight)
+
+    def begin(self):
+        # Called when a request is actually sent, so only one trial runs at a time
+        if self.state == "half-open":
+            self._trial_in_flight = True
+
+    def release(self):
+        # The request was abandoned without an answer either way
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+class LatencyTracker:
+    # Rolling window of successful call durations for one backend
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(p * len(ordered)))
+        return ordered[index]
+
+class TranslationPolicy:
+    """
+    Runs translations against an ordered list of backends.
+
+    The first backend whose circuit is closed is the primary. If it hasn't
+    answered by the time its usual latency (the `hedge_percentile` of recent
+    calls) has passed, the same request is also sent to the next backend and
+    whichever answers first wins. A backend that fails is failed over to the
+    next one straight away. Everything is abandoned after `deadline_seconds`.
+    """
+
+    def __init__(self, backends, deadline_seconds=20, hedge_percentile=0.95,
+                 min_hedge_samples=10, failure_threshold=3, cooldown_seconds=60):
+        if not backends:
+            raise ValueError("TranslationPolicy needs at least one backend")
+        self.backends = backends
+        self.deadline_seconds = deadline_seconds
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_samples = min_hedge_samples
+        self.breakers = {b.name: CircuitBreaker(failure_threshold, cooldown_seconds) for b in backends}
+        self.latencies = {b.name: LatencyTracker() for b in backends}
+        self.hedges_fired = 0
+        self.failovers = 0
+        self.wins = {b.name: 0 for b in backends}
+
+    def _available_backends(self):
+        return [b for b in self.backends if self.breakers[b.name].allow()]
+
+    def hedge_delay(self, backend):
+        tracker = self.latencies[backend.name]
+        if len(tracker.samples) < self.min_hedge_samples:
+            # Not enough history yet, so only hedge a call that is clearly slow
+            return self.deadline_seconds / 2
+        return tracker.percentile(self.hedge_percentile)
+
+    async def _call(self, backend, texts, from_lang, to_lang):
+        start = time.monotonic()
+        try:
+            result = await asyncio.to_thread(backend.translate_batch, texts, from_lang, to_lang)
+        except asyncio.CancelledError:
+            self.breakers[backend.name].release()
+            raise
+        except Exception:
+            self.breakers[backend.name].record_failure()
+            raise
+        self.breakers[backend.name].record_success()
+        self.latencies[backend.name].record(time.monotonic() - start)
+        return result
+
+    async def translate_batch(self, texts, from_lang="he", to_lang="en"):
+        candidates = self._available_backends()
+        if not candidates:
+            raise TranslationUnavailable("All translation backends are failing")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        running = {}  # task -> backend
+        next_index = 0
+        last_error = None
+
+        def launch():
+            nonlocal next_index
+            backend = candidates[next_index]
+            next_index += 1
+            self.breakers[backend.name].begin()
+            task = asyncio.create_task(self._call(backend, texts, from_lang, to_lang))
+            running[task] = backend
+
+        launch()
+        try:
+            while running:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                can_hedge = next_index < len(candidates)
+                wait_for = min(remaining, self.hedge_delay(candidates[0])) if can_hedge else remaining
+                done, _ = await asyncio.wait(running, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if can_hedge:
+                        self.hedges_fired += 1
+                        launch()
+                    continue
+                for task in done:
+                    backend = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        log.warning(f"Translation backend {backend.name} failed: {e}", backend=backend.name)
+                        last_error = e
+                        if next_index < len(candidates):
+                            self.failovers += 1
+                            launch()
+                        continue
+                    self.wins[backend.name] += 1
+                    return result
+        finally:
+            for task in running:
+                task.cancel()
+        if last_error and not running:
+            raise last_error
+        raise asyncio.TimeoutError(f"No translation backend answered within {self.deadline_seconds}s")
+
+    def translate_batch_blocking(self, texts, from_lang="he", to_lang="en"):
+        # Synchronous variant for scripts: plain failover, no hedging
+        last_error = None
+        for backend in self._available_backends():
+            self.breakers[backend.name].begin()
+            try:
+                result = backend.translate_batch(texts, from_lang, to_lang)
+            except Exception as e:
+                self.breakers[backend.name].record_failure()
+                last_error = e
+                continue
+            self.breakers[backend.name].record_success()
+            return result
+        raise last_error or TranslationUnavailable("All translation backends are failing")
+
+    def stats(self):
+        return {
+            "hedges_fired": self.hedges_fired,
+            "failovers": self.failovers,
+            "wins": dict(self.wins),
+            "circuits": {name: breaker.state for name, breaker in self.breakers.items()},
+        }
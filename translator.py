@@ -1,21 +1,103 @@
-import os
-from dotenv import load_dotenv
-import google.generativeai as genai
+import asyncio
+import config
+from translation_cache import TranslationCache
+from state_store import store
+from translation_batcher import TranslationBatcher
+from translation_backends import create_backend
+from translation_policy import TranslationPolicy
+from structured_log import get_logger
 
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY is not set in .env")
+log = get_logger(__name__)
 
-genai.configure(api_key=GEMINI_API_KEY)
+def _create_backends():
+    backends = []
+    for name in config.TRANSLATION_BACKENDS:
+        backend = create_backend(name)
+        if backend is None:
+            log.warning(f"Translation backend '{name}' has no API key in .env, skipping it")
+            continue
+        backends.append(backend)
+    if not backends:
+        raise ValueError("No translation backend is available, set GEMINI_API_KEY or DEEPL_API_KEY in .env")
+    return backends
+
+translation_policy = TranslationPolicy(
+    _create_backends(),
+    deadline_seconds=config.TRANSLATION_TIMEOUT_SECONDS,
+    hedge_percentile=config.TRANSLATION_HEDGE_PERCENTILE,
+    failure_threshold=config.TRANSLATION_CIRCUIT_FAILURES,
+    cooldown_seconds=config.TRANSLATION_CIRCUIT_COOLDOWN_SECONDS
+)
+
+translation_cache = TranslationCache(
+    store,
+    max_memory_entries=config.TRANSLATION_CACHE_MEMORY_ENTRIES
+)
+
+# Created lazily so they bind to the running event loop
+_semaphore = None
+_batcher = None
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(config.TRANSLATION_MAX_CONCURRENCY)
+    return _semaphore
+
+async def _translate_batch_async(texts, from_lang="he", to_lang="en"):
+    async with _get_semaphore():
+        return await translation_policy.translate_batch(texts, from_lang, to_lang)
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        _batcher = TranslationBatcher(
+            _translate_batch_async,
+            window_seconds=config.TRANSLATION_BATCH_WINDOW_SECONDS,
+            max_items=config.TRANSLATION_BATCH_MAX_ITEMS,
+            max_chars=config.TRANSLATION_BATCH_MAX_CHARS,
+            max_in_flight=config.TRANSLATION_MAX_CONCURRENCY
+        )
+    return _batcher
 
 def translate(text, from_lang="he", to_lang="en"):
-    # Use Gemini to translate text from Hebrew to English
-    prompt = f"Translate the following tex to English. Only output the translation, no explanation.\n\nText: {text}"
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    response = model.generate_content(prompt)
-    # The response.text contains the translation
-    return response.text.strip()
+    cached = translation_cache.get(text, from_lang, to_lang)
+    if cached is not None:
+        return cached
+    translated = translation_policy.translate_batch_blocking([text], from_lang, to_lang)[0]
+    translation_cache.put(text, translated, from_lang, to_lang)
+    return translated
+
+async def translate_async(text, from_lang="he", to_lang="en", timeout=None):
+    """
+    Translate without blocking the event loop.
+    Backend calls run in worker threads, at most TRANSLATION_MAX_CONCURRENCY
+    at a time, and cached translations are returned without calling a
+    backend at all. With TRANSLATION_BATCHING on, concurrent calls may share
+    one backend request. Slow or failing backends are hedged and failed over
+    by the translation policy. Raises asyncio.TimeoutError if the call takes
+    longer than `timeout` seconds.
+    """
+    # Cache hits are answered inline without taking a concurrency slot
+    cached = translation_cache.get(text, from_lang, to_lang)
+    if cached is not None:
+        return cached
+    if timeout is None:
+        timeout = config.TRANSLATION_TIMEOUT_SECONDS
+    if config.TRANSLATION_BATCHING:
+        translated = await asyncio.wait_for(
+            _get_batcher().translate(text, from_lang, to_lang),
+            timeout=timeout
+        )
+    else:
+        translations = await asyncio.wait_for(
+            _translate_batch_async([text], from_lang, to_lang),
+            timeout=timeout
+        )
+        translated = translations[0]
+    translation_cache.put(text, translated, from_lang, to_lang)
+    return translated
 
 if __name__ == "__main__":
     print(translate("🇮🇱 הגרדיאן: איראן תחשוף הערב טכנולוגיית טילים חדשה ותבחן אותה על ידי ירי מספר טילים לעבר ישראל."))
+    print(translation_policy.stats())